@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+对比Cache文件后端与SqliteCache的每秒操作数
+用法: python benchmarks/cache_backends.py [条目数]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fize.utils.cache import Cache, SqliteCache
+
+
+def measure(name, func, count):
+    """
+    执行count次操作并输出每秒操作数
+    :param name: 名称
+    :param func: 以序号为参数的操作函数
+    :param count: 操作次数
+    :return: void
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print("%-40s %12.0f ops/s" % (name, count / elapsed))
+
+
+def run(name, cache, count):
+    """
+    对一个后端执行set/get/has/remove测试
+    :param name: 后端名称
+    :param cache: 缓存对象
+    :param count: 条目数
+    :return: void
+    """
+    value = {'id': 1, 'name': "fize", 'tags': ["a", "b", "c"]}
+    measure(name + " set", lambda i: cache.set("key:" + str(i), value, duration=3600), count)
+    if isinstance(cache, SqliteCache):
+        cache.commit()
+    measure(name + " get", lambda i: cache.get("key:" + str(i)), count)
+    measure(name + " has", lambda i: cache.has("key:" + str(i)), count)
+    measure(name + " get (miss)", lambda i: cache.get("miss:" + str(i)), count)
+    measure(name + " remove", lambda i: cache.remove("key:" + str(i)), count)
+    if isinstance(cache, SqliteCache):
+        cache.commit()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    root = tempfile.mkdtemp(prefix="fize-bench-")
+    try:
+        run("Cache", Cache(os.path.join(root, "files")), count)
+        run("SqliteCache", SqliteCache(os.path.join(root, "every.sqlite3")), count)
+        run("SqliteCache(commit_every=500)", SqliteCache(os.path.join(root, "batch.sqlite3"), commit_every=500), count)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,240 @@
+# -*- coding: utf-8 -*-
+
+import decimal
+import hashlib
+import threading
+
 import pymysql
 
+from fize.utils.cache import Cache
+
 
 class Mysql:
+    """
+    MySQL数据库结构目录
+    一次性加载INFORMATION_SCHEMA中的字段类型、主键及索引信息，缓存于内存及磁盘，
+    通过字段及索引的校验和判断表结构是否变更，供OrmMysql在每次调用时无需再查询元数据。
+    """
+
+    INTEGER_TYPES = ("tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year")
+
+    FLOAT_TYPES = ("float", "double", "real")
+
+    DECIMAL_TYPES = ("decimal", "numeric")
+
+    STRING_TYPES = ("char", "varchar", "tinytext", "text", "mediumtext", "longtext", "enum", "set")
+
+    def __init__(self, conn, database=None, cache_path=None):
+        """
+        初始化并加载数据库结构
+        :param conn: pymysql原生连接
+        :param database: 数据库名，不指定则使用连接的当前数据库
+        :param cache_path: 磁盘缓存路径，不指定则不使用磁盘缓存
+        """
+        self.__conn = conn
+        self.__lock = threading.Lock()
+        if database is None:
+            database = self.__fetch("SELECT DATABASE() AS db")[0]['db']
+        self.__database = database
+        self.__cache = Cache(cache_path) if cache_path is not None else None
+        self.__fingerprint = None
+        self.__tables = {}
+        self.load()
+
+    @staticmethod
+    def versions():
+        """
+        获取pymysql版本及客户端版本
+        :return: tuple
+        """
+        return pymysql.VERSION, pymysql.get_client_info()
+
+    @property
+    def database(self):
+        """
+        数据库名
+        :return: str
+        """
+        return self.__database
+
+    def __fetch(self, sql, params=None):
+        """
+        执行查询并返回记录数组
+        :param sql: SQL语句
+        :param params: 绑定参数
+        :return: list
+        """
+        with self.__lock:
+            cursor = self.__conn.cursor(pymysql.cursors.DictCursor)
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def __compute_fingerprint(self):
+        """
+        计算表结构校验值，任意表、字段或索引发生变更时校验值随之改变
+        :return: str
+        """
+        columns = self.__fetch(
+            "SELECT COUNT(*) AS n, SUM(CRC32(CONCAT_WS(',', TABLE_NAME, COLUMN_NAME, ORDINAL_POSITION, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY))) AS crc "
+            "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA=%s", [self.__database])
+        indexes = self.__fetch(
+            "SELECT COUNT(*) AS n, SUM(CRC32(CONCAT_WS(',', TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME, NON_UNIQUE))) AS crc "
+            "FROM information_schema.STATISTICS WHERE TABLE_SCHEMA=%s", [self.__database])
+        source = str(columns[0]['n']) + ":" + str(columns[0]['crc']) + ":" + str(indexes[0]['n']) + ":" + str(indexes[0]['crc'])
+        return hashlib.md5(source.encode("utf-8")).hexdigest()
+
+    def __load_tables(self):
+        """
+        从INFORMATION_SCHEMA加载全部表结构
+        :return: dict 表名 => 表结构
+        """
+        tables = {}
+        columns = self.__fetch(
+            "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, COLUMN_TYPE, IS_NULLABLE, COLUMN_DEFAULT, COLUMN_KEY, EXTRA "
+            "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA=%s ORDER BY TABLE_NAME, ORDINAL_POSITION", [self.__database])
+        for row in columns:
+            table = tables.setdefault(row['TABLE_NAME'], {'columns': {}, 'pk': [], 'indexes': {}})
+            table['columns'][row['COLUMN_NAME']] = {
+                'type': row['DATA_TYPE'].lower(),
+                'column_type': row['COLUMN_TYPE'],
+                'nullable': row['IS_NULLABLE'] == "YES",
+                'default': row['COLUMN_DEFAULT'],
+                'extra': row['EXTRA']
+            }
+        indexes = self.__fetch(
+            "SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME, NON_UNIQUE FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA=%s ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX", [self.__database])
+        for row in indexes:
+            if row['TABLE_NAME'] not in tables:
+                continue
+            table = tables[row['TABLE_NAME']]
+            index = table['indexes'].setdefault(row['INDEX_NAME'], {'columns': [], 'unique': int(row['NON_UNIQUE']) == 0})
+            index['columns'].append(row['COLUMN_NAME'])
+            if row['INDEX_NAME'] == "PRIMARY":
+                table['pk'].append(row['COLUMN_NAME'])
+        return tables
+
+    def load(self, force=False):
+        """
+        加载数据库结构，结构未变更时依次使用内存缓存及磁盘缓存
+        :param force: 是否强制从INFORMATION_SCHEMA重新加载
+        :return: bool 是否从INFORMATION_SCHEMA重新加载
+        """
+        fingerprint = self.__compute_fingerprint()
+        if not force and fingerprint == self.__fingerprint:
+            return False
+        key = "mysql_schema_" + self.__database
+        if not force and self.__cache is not None:
+            cached = self.__cache.get(key)
+            if cached is not None and cached['fingerprint'] == fingerprint:
+                self.__tables = cached['tables']
+                self.__fingerprint = fingerprint
+                return False
+        self.__tables = self.__load_tables()
+        self.__fingerprint = fingerprint
+        if self.__cache is not None:
+            self.__cache.set(key, {'fingerprint': fingerprint, 'tables': self.__tables})
+        return True
+
+    def check(self):
+        """
+        检查表结构是否变更，变更时重新加载，执行DDL后调用
+        :return: bool 是否重新加载
+        """
+        return self.load()
+
+    def close(self):
+        """
+        关闭结构目录使用的数据库连接
+        :return: void
+        """
+        with self.__lock:
+            self.__conn.close()
+
+    def has_table(self, table):
+        """
+        判断表是否存在
+        :param table: 完整表名
+        :return: bool
+        """
+        return table in self.__tables
+
+    def columns(self, table):
+        """
+        获取表的字段信息
+        :param table: 完整表名
+        :return: dict 字段名 => 字段信息，表不存在时返回None
+        """
+        if table not in self.__tables:
+            return None
+        return self.__tables[table]['columns']
+
+    def primary_key(self, table):
+        """
+        获取表的主键字段
+        :param table: 完整表名
+        :return: list 主键字段数组，表不存在时返回None
+        """
+        if table not in self.__tables:
+            return None
+        return self.__tables[table]['pk']
+
+    def indexes(self, table):
+        """
+        获取表的索引信息
+        :param table: 完整表名
+        :return: dict 索引名 => {'columns': 字段数组, 'unique': 是否唯一}，表不存在时返回None
+        """
+        if table not in self.__tables:
+            return None
+        return self.__tables[table]['indexes']
+
+    @classmethod
+    def convert_value(cls, column, value):
+        """
+        按字段类型在客户端转换值，只做不改变取值的转换，可能丢失精度或改变含义的值原样交给MySQL处理
+        :param column: 字段信息
+        :param value: 值
+        :return: mixed
+        """
+        if value is None:
+            return None
+        data_type = column['type']
+        try:
+            if data_type in cls.INTEGER_TYPES:
+                if isinstance(value, bool) or isinstance(value, str):
+                    return int(value)
+                if isinstance(value, float) and value.is_integer():
+                    return int(value)
+            elif data_type in cls.FLOAT_TYPES:
+                if isinstance(value, str):
+                    return float(value)
+                if isinstance(value, decimal.Decimal) and float(value) == value:
+                    return float(value)
+            elif data_type in cls.DECIMAL_TYPES:
+                if isinstance(value, str) or isinstance(value, int) or isinstance(value, float):
+                    return decimal.Decimal(str(value))
+            elif data_type in cls.STRING_TYPES:
+                if (isinstance(value, int) and not isinstance(value, bool)) or isinstance(value, decimal.Decimal):
+                    return str(value)
+        except (ValueError, decimal.InvalidOperation):
+            pass
+        return value
 
-    def __init__(self):
-        print(pymysql.VERSION)
-        print(pymysql.get_client_info())
+    def prepare(self, table, datadict):
+        """
+        丢弃表中不存在的字段并按字段类型转换值，表不存在时原样返回
+        :param table: 完整表名
+        :param datadict: 数据词典
+        :return: dict
+        """
+        columns = self.columns(table)
+        if columns is None:
+            return datadict
+        result = {}
+        for key, val in datadict.items():
+            if key in columns:
+                result[key] = self.convert_value(columns[key], val)
+        return result
@@ -1,12 +1,223 @@
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
 from functools import wraps
 
+try:
+    from queue import SimpleQueue
+except ImportError:  # Python 3.6
+    from queue import Queue as SimpleQueue
+
+
+class LogWriter:
+    """
+    后台日志写入线程
+    调用方只需将记录放入队列，由后台线程保持文件打开、合并写入，按缓冲字节数或时间间隔刷新，
+    按文件大小或时间轮转，轮转时未写入的记录保留在缓冲区中，进程退出时写完队列中的全部记录。
+    同一日志文件的多个Logit共享一个LogWriter。
+    """
+
+    __writers = {}  # 日志文件绝对路径 => LogWriter
+
+    __writers_lock = threading.Lock()
+
+    __STOP = object()
+
+    def __init__(self, path, buffer_size=65536, flush_interval=1.0, max_bytes=None, rotate_interval=None, backup_count=5):
+        """
+        初始化并启动后台线程
+        :param path: 日志文件路径
+        :param buffer_size: 缓冲的字节数达到该值时写入文件
+        :param flush_interval: 缓冲的记录最长保留时间，单位秒
+        :param max_bytes: 日志文件超过该字节数时轮转，None表示不按大小轮转
+        :param rotate_interval: 每隔多少秒轮转一次，None表示不按时间轮转
+        :param backup_count: 轮转时保留的历史文件数(path.1为最新)
+        """
+        self.__path = path
+        self.__buffer_size = buffer_size
+        self.__flush_interval = flush_interval
+        self.__max_bytes = max_bytes
+        self.__rotate_interval = rotate_interval
+        self.__backup_count = backup_count
+        self.__closed = False
+        self.__start()
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.__start)  # 子进程中后台线程不存在，重新启动
+
+    @classmethod
+    def get(cls, path, **options):
+        """
+        获取日志文件对应的LogWriter，不存在时创建
+        :param path: 日志文件路径
+        :param options: 创建时传递给LogWriter的参数
+        :return: LogWriter
+        """
+        name = os.path.abspath(path)
+        with cls.__writers_lock:
+            writer = cls.__writers.get(name)
+            if writer is None:
+                writer = cls(path, **options)
+                cls.__writers[name] = writer
+            return writer
+
+    def __start(self):
+        """
+        创建队列并启动后台线程
+        :return: void
+        """
+        self.__queue = SimpleQueue()
+        self.__thread = threading.Thread(target=self.__run, name="fize-log-writer", daemon=True)
+        self.__thread.start()
+
+    def write(self, line, echo=False):
+        """
+        提交一条记录，不等待写入
+        :param line: 记录内容，不含换行符
+        :param echo: 是否同时输出到标准输出
+        :return: void
+        """
+        self.__queue.put((line, echo))
+
+    def flush(self, timeout=None):
+        """
+        等待此前提交的记录全部写入文件，已关闭时等待后台线程写完剩余记录
+        :param timeout: 最长等待时间，单位秒
+        :return: bool 是否在超时前完成
+        """
+        if self.__closed:
+            self.__thread.join(timeout)
+            return not self.__thread.is_alive()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        done = threading.Event()
+        self.__queue.put(done)
+        while not done.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                return False
+            if not done.wait(wait) and not self.__thread.is_alive():  # 并发调用close()时标记可能排在结束标记之后
+                return done.is_set()
+        return True
+
+    def close(self, timeout=None):
+        """
+        写完队列中的全部记录后关闭文件并停止后台线程，进程退出时自动调用
+        :param timeout: 最长等待时间，单位秒
+        :return: void
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__queue.put(self.__STOP)
+        self.__thread.join(timeout)
+
+    def __run(self):
+        """
+        后台线程主循环
+        :return: void
+        """
+        store = self.__open()
+        rollover = time.time() + self.__rotate_interval if self.__rotate_interval is not None else None
+        lines = []
+        echoes = []
+        size = 0
+        flushed = time.monotonic()
+        while True:
+            if lines:
+                timeout = max(0.0, self.__flush_interval - (time.monotonic() - flushed))
+            else:
+                timeout = None
+            try:
+                item = self.__queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            stop = item is self.__STOP
+            waiter = item if isinstance(item, threading.Event) else None
+            if isinstance(item, tuple):
+                lines.append(item[0] + "\n")
+                if item[1]:
+                    echoes.append(item[0] + "\n")
+                size += len(item[0]) + 1
+                if size < self.__buffer_size and time.monotonic() - flushed < self.__flush_interval:
+                    continue
+            if lines or echoes:
+                try:
+                    if store.closed:  # 上次轮转后未能重新打开
+                        store = self.__open()
+                    if rollover is not None and time.time() >= rollover:
+                        store = self.__rotate(store)
+                        rollover = time.time() + self.__rotate_interval
+                    chunk = "".join(lines)
+                    if self.__max_bytes is not None and store.tell() > 0 and store.tell() + len(chunk) > self.__max_bytes:
+                        store = self.__rotate(store)
+                    store.write(chunk)
+                    store.flush()
+                    if echoes:
+                        sys.stdout.write("".join(echoes))
+                        sys.stdout.flush()
+                except Exception:  # 写入失败时保留缓冲，下次刷新时重试
+                    pass
+                else:
+                    lines = []
+                    echoes = []
+                    size = 0
+            flushed = time.monotonic()
+            if waiter is not None:
+                waiter.set()
+            if stop:
+                store.close()
+                return
+
+    def __open(self):
+        """
+        以追加模式打开日志文件
+        :return: file
+        """
+        directory = os.path.dirname(self.__path)
+        if directory != "" and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        return open(self.__path, 'a')
+
+    def __rotate(self, store):
+        """
+        轮转日志文件：path.N依次后移，当前文件重命名为path.1，再打开新文件
+        重命名失败时重新打开原文件继续写入，下次刷新时再尝试轮转
+        :param store: 当前文件
+        :return: file 新文件
+        """
+        store.close()
+        try:
+            if self.__backup_count > 0:
+                for i in range(self.__backup_count - 1, 0, -1):
+                    source = self.__path + "." + str(i)
+                    if os.path.exists(source):
+                        os.replace(source, self.__path + "." + str(i + 1))
+                os.replace(self.__path, self.__path + ".1")
+            else:
+                os.remove(self.__path)
+        except OSError:
+            pass
+        return self.__open()
+
 
 class Logit:
 
     logfile = None
 
-    def __init__(self, logfile="log.log"):
+    def __init__(self, logfile="log.log", echo=True, writer=None, **options):
+        """
+        初始化
+        :param logfile: 日志文件路径
+        :param echo: 是否同时输出到标准输出
+        :param writer: 指定LogWriter，不指定则使用logfile对应的共享LogWriter
+        :param options: 创建LogWriter时的参数，如buffer_size、flush_interval、max_bytes、rotate_interval、backup_count
+        """
         self.logfile = logfile
+        self.echo = echo
+        self.writer = writer if writer is not None else LogWriter.get(logfile, **options)
 
     @staticmethod
     def notify(self):
@@ -17,11 +228,8 @@ class Logit:
         @wraps(func)
         def decorator_fun(*args, **kwargs):
             log_string = func.__name__ + " was called"
-            print(log_string)
-            # 打开logfile并写入
-            with open(self.logfile, 'a') as opened_file:
-                # 现在将日志打到指定的文件
-                opened_file.write(log_string + '\n')
+            # 交给后台线程写入logfile及输出
+            self.writer.write(log_string, self.echo)
             # 现在，发送一个通知
             self.notify(self)
             return func(*args, **kwargs)
@@ -1,7 +1,85 @@
 # -*- coding: utf-8 -*-
 
+import atexit
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
 import pymysql
 
+from fize.db.mysql import Mysql
+
+
+class QueryTimeoutError(Exception):
+    """
+    SQL语句执行超时被服务端中止
+    """
+    pass
+
+
+class OverloadError(Exception):
+    """
+    并发数已满且排队超时，请求被直接拒绝
+    """
+    pass
+
+
+class PipelineError(Exception):
+    """
+    管道中前序语句执行失败，本语句未被执行
+    """
+    pass
+
+
+class Limiter:
+    """
+    并发限制器
+    限制同时执行的SQL语句数量，排队超过指定时间则抛出OverloadError，使过载请求快速失败而不是层层堆积。
+    同一个限制器可以被多个ORM对象(例如各线程的clone)共享。
+    """
+
+    def __init__(self, max_concurrency, queue_timeout=None):
+        """
+        初始化
+        :param max_concurrency: 最大并发数
+        :param queue_timeout: 最长排队时间，单位秒，None表示一直等待，0表示不排队
+        """
+        self.__semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.__queue_timeout = queue_timeout
+        self.rejected = 0
+
+    def acquire(self):
+        """
+        获取一个执行名额
+        :return: void
+        """
+        if self.__queue_timeout is None:
+            acquired = self.__semaphore.acquire()
+        elif self.__queue_timeout <= 0:
+            acquired = self.__semaphore.acquire(False)
+        else:
+            acquired = self.__semaphore.acquire(timeout=self.__queue_timeout)
+        if not acquired:
+            self.rejected += 1
+            raise OverloadError("并发数已满，排队超时")
+
+    def release(self):
+        """
+        释放执行名额
+        :return: void
+        """
+        self.__semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
 
 class Query:
 
@@ -297,6 +375,8 @@ class OrmMysql:
 
     __tableName = None
 
+    __pk = None
+
     __alias = ""
 
     __join = ""
@@ -325,11 +405,67 @@ class OrmMysql:
 
     __last_sql = ""
 
-    def __init__(self, host, user, password, database, port=3306, charset="utf8"):
+    __query_timeout = None
+
+    __count_cache = {}  # 按写入顺序排列，超出容量时淘汰最早写入的条目
+
+    __count_cache_lock = threading.Lock()
+
+    __count_cache_size = 1024
+
+    # 单表写语句的目标表名，INSERT/REPLACE/DELETE在第1组，UPDATE在第2组
+    __WRITE_TABLE = re.compile(
+        r"^\s*(?:(?:INSERT|REPLACE)(?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE))*(?:\s+INTO)?"
+        r"|DELETE(?:\s+(?:LOW_PRIORITY|QUICK|IGNORE))*\s+FROM)\s+(?!INTO\b)`?(\w+)`?(?=[\s(]|$)"
+        r"|^\s*UPDATE(?:\s+(?:LOW_PRIORITY|IGNORE))*\s+`?(\w+)`?\s+SET\b", re.I)
+
+    def __init__(self, host, user, password, database, port=3306, charset="utf8", timeout=None, limiter=None, schema=None):
+        """
+        初始化
+        :param host: 主机
+        :param user: 用户名
+        :param password: 密码
+        :param database: 数据库名
+        :param port: 端口
+        :param charset: 字符集
+        :param timeout: 默认的SQL语句超时时间，单位秒，None表示不限制
+        :param limiter: 并发限制器Limiter，None表示不限制
+        :param schema: 数据库结构目录，可传入fize.db.mysql.Mysql对象，True表示自动创建，None表示不使用
+        """
+        self.__config = {
+            'host': host,
+            'user': user,
+            'password': password,
+            'database': database,
+            'port': port,
+            'charset': charset,
+            'timeout': timeout,
+            'limiter': limiter,
+            'schema': schema
+        }
+        self.__timeout = timeout
+        self.__limiter = limiter
+        self.__multi_conn = None
         self.__conn = pymysql.connect(host=host, user=user, password=password, database=database, port=port, charset=charset)
+        if schema is True:
+            # 结构目录使用独立连接：clone共享同一个目录，可能在其他线程中调用check()，且不随本对象的连接关闭而失效
+            catalog_conn = self.__connect()
+            catalog_conn.autocommit(True)
+            schema = Mysql(catalog_conn, database)
+            self.__config['schema'] = schema  # clone共享同一个结构目录
+        self.__schema = schema if schema else None
+        # 参数数组必须为实例属性，否则多个实例(多线程)之间会共享同一个类属性数组
+        self.__whereParams = []
+        self.__havingParams = []
+        self.__params = []
+        self.__related = []
+        self.__identity = {}
+        self.__aux = None
 
     def __del__(self):
         self.__conn.close()
+        if self.__multi_conn is not None:
+            self.__multi_conn.close()
 
     @property
     def prototype(self):
@@ -339,11 +475,59 @@ class OrmMysql:
         """
         return self.__conn
 
-    def table(self, name, prefix=None):
+    @property
+    def schema(self):
+        """
+        当前使用的数据库结构目录
+        :return: Mysql
+        """
+        return self.__schema
+
+    def __primary_key(self):
+        """
+        获取当前表的主键字段，未指定时使用结构目录中的单字段主键
+        :return: str 无法确定时返回None
+        """
+        if self.__pk is not None:
+            return self.__pk
+        if self.__schema is not None:
+            pk = self.__schema.primary_key(self.__tablePrefix + self.__tableName)
+            if pk is not None and len(pk) == 1:
+                return pk[0]
+        return None
+
+    def __prepare(self, datadict):
+        """
+        存在结构目录时丢弃未知字段并按字段类型转换值，全部字段均未知时抛出ValueError
+        :param datadict: 数据词典
+        :return: dict
+        """
+        if self.__schema is None:
+            return datadict
+        table = self.__tablePrefix + self.__tableName
+        result = self.__schema.prepare(table, datadict)
+        if len(result) == 0 and len(datadict) > 0:
+            self.__clear_environment()  # 不让本次的条件残留到下一条语句
+            raise ValueError("表" + table + "中不存在字段: " + ", ".join([str(key) for key in datadict]))
+        return result
+
+    def clone(self):
+        """
+        使用相同的连接参数创建一个拥有独立连接的ORM对象，并保留当前指定的表
+        pymysql连接不是线程安全的，多线程场景下每个线程应使用各自的clone
+        :return: OrmMysql
+        """
+        orm = OrmMysql(**self.__config)
+        if self.__tableName is not None:
+            orm.table(self.__tableName, self.__tablePrefix, self.__pk)
+        return orm
+
+    def table(self, name, prefix=None, pk=None):
         """
         指定当前操作的表，支持链式调用
         :param name: 表名
         :param prefix: 表前缀
+        :param pk: 主键字段名，get()/get_many()需要指定
         :return: OrmMysql
         """
         self.__tableName = name
@@ -351,6 +535,7 @@ class OrmMysql:
             self.__tablePrefix = prefix
         else:
             self.__tablePrefix = ""
+        self.__pk = pk
         return self
 
     def alias(self, alias):
@@ -472,6 +657,91 @@ class OrmMysql:
     def having(self, sql):
         return self
 
+    def timeout(self, seconds):
+        """
+        设置本次查询的超时时间，优先于默认超时时间，支持链式调用
+        :param seconds: 超时时间，单位秒
+        :return: OrmMysql
+        """
+        self.__query_timeout = seconds
+        return self
+
+    def with_related(self, name, table=None, local_key=None, foreign_key=None, many=False, fields=None, prefix=None, chunk=1000):
+        """
+        预加载关联记录，主查询结束后每个关联只使用一次IN查询(超过chunk个键时分批)获取全部关联记录，避免N+1查询，支持链式调用
+        嵌套关联使用“.”连接，如“author.profile”表示加载author关联记录的profile关联，需先声明上级关联
+        :param name: 关联名，关联记录以该名称(嵌套关联取最后一段)设置到每条记录中
+        :param table: 关联表名，默认与关联名相同
+        :param local_key: 本表关联字段，默认一对一时为“关联名_id”，一对多时为“id”
+        :param foreign_key: 关联表关联字段，默认一对一时为“id”，一对多时必须指定
+        :param many: 是否一对多，一对多时设置为记录数组，否则设置为单条记录或None
+        :param fields: 关联表要查询的字段，必须包含foreign_key
+        :param prefix: 关联表前缀，默认使用当前表前缀
+        :param chunk: 每次IN查询的最大键数量
+        :return: OrmMysql
+        """
+        attr = name.rpartition(".")[2]
+        if table is None:
+            table = attr
+        if local_key is None:
+            local_key = "id" if many else attr + "_id"
+        if foreign_key is None:
+            if many:
+                raise ValueError("一对多关联必须指定foreign_key")
+            foreign_key = "id"
+        if isinstance(fields, list):
+            fields = ",".join(fields)
+        if fields is None:
+            fields = "*"
+        if prefix is None:
+            prefix = self.__tablePrefix
+        self.__related.append({
+            'name': name,
+            'table': prefix + table,
+            'local_key': local_key,
+            'foreign_key': foreign_key,
+            'many': many,
+            'fields': fields,
+            'chunk': chunk
+        })
+        return self
+
+    def __load_related(self, rows, related):
+        """
+        为查询结果加载关联记录
+        :param rows: 主查询结果
+        :param related: 关联定义数组
+        :return: void
+        """
+        loaded = {"": rows}
+        for relation in sorted(related, key=lambda item: item['name'].count(".")):
+            parent, _, attr = relation['name'].rpartition(".")
+            if parent not in loaded:
+                raise ValueError("未声明上级关联: " + parent)
+            parents = loaded[parent]
+            keys = []
+            seen = set()
+            for row in parents:
+                key = row.get(relation['local_key'])
+                if key is not None and key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+            index = {}
+            children = []
+            for i in range(0, len(keys), relation['chunk']):
+                part = keys[i:i + relation['chunk']]
+                sql = "SELECT " + relation['fields'] + " FROM `" + relation['table'] + "` WHERE `" + relation['foreign_key'] + "` IN(" + ",".join(["%s" for key in part]) + ")"
+                for child in self.query(sql, part):
+                    index.setdefault(child[relation['foreign_key']], []).append(child)
+                    children.append(child)
+            for row in parents:
+                matched = index.get(row.get(relation['local_key']), [])
+                if relation['many']:
+                    row[attr] = matched
+                else:
+                    row[attr] = matched[0] if len(matched) > 0 else None
+            loaded[relation['name']] = children
+
     def field(self, fields):
         """
         指定要查询的字段，支持链式调用
@@ -492,6 +762,8 @@ class OrmMysql:
         :param datadict: 可能需要的数据词典
         :return: string 最后组装的SQL语句
         """
+        if datadict is not None:
+            datadict = self.__prepare(datadict)
         if action == "DELETE":  # 删除
             sql = "DELETE FROM `" + self.__tablePrefix + self.__tableName + "`"
             self.__params = self.__whereParams + self.__havingParams
@@ -575,6 +847,8 @@ class OrmMysql:
         self.__union = ""
 
         self.__sql = ""
+        self.__query_timeout = None
+        self.__related = []
 
         # self.__havingParams = []
         # self.__whereParams = []
@@ -584,26 +858,156 @@ class OrmMysql:
         self.__whereParams.clear()
         self.__params.clear()
 
-    def query(self, sql, params=None):
+    def __connect(self, client_flag=0):
+        """
+        使用相同的连接参数创建一个新的原生连接
+        :param client_flag: 客户端标识
+        :return: Connection
+        """
+        return pymysql.connect(host=self.__config['host'], user=self.__config['user'], password=self.__config['password'], database=self.__config['database'], port=self.__config['port'], charset=self.__config['charset'], client_flag=client_flag)
+
+    def pipeline(self):
+        """
+        创建语句管道，收集的多条语句在一个开启CLIENT_MULTI_STATEMENTS的连接上一次发送
+        管道执行写语句后从标识映射中移除涉及的表
+        :return: Pipeline
+        """
+        if self.__multi_conn is None:
+            self.__multi_conn = self.__connect(pymysql.constants.CLIENT.MULTI_STATEMENTS)
+        return Pipeline(self.__multi_conn, self.__limiter, self.__pipeline_written)
+
+    def __pipeline_written(self, sqls):
+        """
+        管道执行写语句后的回调，从标识映射中移除语句涉及的表，无法识别表名时清空标识映射
+        :param sqls: 写语句数组
+        :return: void
+        """
+        for sql in sqls:
+            match = self.__WRITE_TABLE.match(sql)
+            if match is None:
+                self.__identity.clear()
+                return
+            self.__identity.pop(match.group(1) or match.group(2), None)
+
+    def build(self, action="SELECT", datadict=None):
+        """
+        根据当前条件构建SQL语句但不执行，用于管道等场景
+        :param action: SQL语句类型
+        :param datadict: INSERT/REPLACE/UPDATE需要的数据词典
+        :return: tuple (SQL语句, 绑定参数)
+        """
+        if action == "SELECT" and self.__fields == "":
+            self.field(None)
+        sql = self.__build_sql(action, datadict)
+        params = list(self.__params)
+        self.__clear_environment()
+        return sql, params
+
+    def __kill(self, thread_id, running, guard=None):
+        """
+        通过旁路连接中止指定连接上正在执行的语句
+        :param thread_id: 要中止的连接ID
+        :param running: 语句仍在执行的标识，语句已结束则不再中止
+        :param guard: 与执行方共用的锁，检查标识及发送KILL期间持有，执行方须获取该锁后才能复用连接
+        :return: void
+        """
+        if guard is None:
+            self.__send_kill(thread_id, running)
+            return
+        with guard:
+            self.__send_kill(thread_id, running)
+
+    def __send_kill(self, thread_id, running):
+        """
+        语句仍在执行时发送KILL QUERY
+        :param thread_id: 要中止的连接ID
+        :param running: 语句仍在执行的标识，None表示无条件中止
+        :return: void
+        """
+        if running is not None and not running.is_set():
+            return
+        conn = self.__connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("KILL QUERY " + str(int(thread_id)))
+            cursor.close()
+        finally:
+            conn.close()
+
+    def cancel(self):
+        """
+        中止当前连接上正在执行的语句，可在其他线程中调用
+        :return: void
+        """
+        self.__kill(self.__conn.thread_id(), None)
+
+    def __execute(self, sql, params=None, timeout=None, dict_cursor=False):
+        """
+        在并发限制及超时控制下执行SQL语句
+        SELECT语句使用MAX_EXECUTION_TIME提示由服务端中止，其余语句到时后通过旁路连接KILL QUERY
+        :param sql: SQL语句
+        :param params: 绑定参数
+        :param timeout: 超时时间，None表示依次使用本次查询超时及默认超时
+        :param dict_cursor: 是否使用字典游标
+        :return: tuple (游标, 受影响行数)
+        """
+        if timeout is None:
+            timeout = self.__query_timeout if self.__query_timeout is not None else self.__timeout
+        if self.__limiter is not None:
+            self.__limiter.acquire()
+        running = None
+        guard = None
+        killer = None
+        try:
+            if timeout is not None:
+                if sql[:6].upper() == "SELECT":
+                    if not sql[6:].lstrip().startswith("/*+"):
+                        sql = "SELECT /*+ MAX_EXECUTION_TIME(" + str(int(timeout * 1000)) + ") */" + sql[6:]
+                else:
+                    running = threading.Event()
+                    running.set()
+                    guard = threading.Lock()
+                    killer = threading.Timer(timeout, self.__kill, [self.__conn.thread_id(), running, guard])
+                    killer.daemon = True
+                    killer.start()
+            if dict_cursor:
+                cursor = self.__conn.cursor(pymysql.cursors.DictCursor)
+            else:
+                cursor = self.__conn.cursor()
+            try:
+                effect_row = cursor.execute(sql, params)
+            except pymysql.err.OperationalError as e:
+                # 1317: Query execution was interrupted，3024: maximum statement execution time exceeded
+                if timeout is not None and len(e.args) > 0 and e.args[0] in (1317, 3024):
+                    raise QueryTimeoutError("SQL语句执行超过" + str(timeout) + "秒: " + sql) from e
+                raise
+            return cursor, effect_row
+        finally:
+            if killer is not None:
+                killer.cancel()
+                with guard:  # 等待正在发送的KILL完成，避免中止该连接上的下一条语句
+                    running.clear()
+            if self.__limiter is not None:
+                self.__limiter.release()
+
+    def query(self, sql, params=None, timeout=None):
         """
         执行一个SQL语句并返回相应结果
         :param sql: SQL语句，支持%s占位符预处理
         :param params: 可选的绑定参数
+        :param timeout: 可选的超时时间，单位秒，超时抛出QueryTimeoutError
         :return: mixed SELECT语句返回数组或不返回，INSERT/REPLACE返回自增ID，其余返回受影响行数
         """
         if sql[:6].upper() == "INSERT" or sql[:7].upper() == "REPLACE":
-            cursor = self.__conn.cursor()
-            cursor.execute(sql, params)
+            cursor, effect_row = self.__execute(sql, params, timeout)
             self.__conn.commit()
             cursor.close()
             return cursor.lastrowid  # 返回自增ID
         elif sql[:6].upper() == "SELECT":
-            cursor = self.__conn.cursor(pymysql.cursors.DictCursor)
-            cursor.execute(sql, params)
+            cursor, effect_row = self.__execute(sql, params, timeout, True)
             return cursor.fetchall()  # 返回数组
         else:
-            cursor = self.__conn.cursor()
-            effect_row = cursor.execute(sql, params)
+            cursor, effect_row = self.__execute(sql, params, timeout)
             self.__conn.commit()
             cursor.close()
             return effect_row  # 返回受影响条数
@@ -619,6 +1023,47 @@ class OrmMysql:
         self.__clear_environment()
         return new_id
 
+    def add_all(self, datalist):
+        """
+        以单条多行INSERT语句批量插入记录
+        :param datalist: 数据词典组成的数组，每个词典的键名必须一致
+        :return: 受影响记录条数
+        """
+        if len(datalist) == 0:
+            return 0
+        datalist = [self.__prepare(datadict) for datadict in datalist]
+        fields = list(datalist[0].keys())
+        holder = "(" + ",".join(["%s" for field in fields]) + ")"
+        params = []
+        for datadict in datalist:
+            if len(datadict) != len(fields):
+                raise ValueError("add_all要求所有数据词典的键名一致")
+            for field in fields:
+                params.append(datadict[field])
+        sql = "INSERT INTO `" + self.__tablePrefix + self.__tableName + "` (`" + "`,`".join(fields) + "`) VALUES " + ",".join([holder for datadict in datalist])
+        self.__last_sql = sql
+        cursor, effect_row = self.__execute(sql, params)
+        self.__conn.commit()
+        cursor.close()
+        self.__clear_environment()
+        return effect_row
+
+    def batch_writer(self, **kwargs):
+        """
+        创建绑定当前表的批量写入器，参数参见BatchWriter
+        :return: BatchWriter
+        """
+        return BatchWriter(self.clone(), **kwargs)
+
+    def mirror(self, **kwargs):
+        """
+        创建当前表的内存镜像，参数参见TableMirror
+        :return: TableMirror
+        """
+        if 'pk' not in kwargs and self.__primary_key() is not None:
+            kwargs['pk'] = self.__primary_key()
+        return TableMirror(self.clone(), self.__tablePrefix + self.__tableName, **kwargs)
+
     def replace(self, datadict):
         """
         以替换形式添加记录，返回自增ID
@@ -627,9 +1072,407 @@ class OrmMysql:
         """
         self.__build_sql("REPLACE", datadict)
         new_id = self.query(self.__sql, self.__params)
+        pk = self.__primary_key()
+        if pk is not None and pk in datadict:
+            self.__evict_identity([datadict[pk]])
+        else:
+            self.__evict_identity()
         self.__clear_environment()
         return new_id
 
+    def __identity_rows(self):
+        """
+        获取当前表在标识映射中的记录词典
+        :return: dict 主键值 => 记录
+        """
+        if self.__primary_key() is None:
+            raise ValueError("当前表未指定主键，请使用table(name, pk=...)指定")
+        return self.__identity.setdefault(self.__tablePrefix + self.__tableName, {})
+
+    def __evict_identity(self, values=None):
+        """
+        从标识映射中移除当前表的记录
+        :param values: 要移除的主键值数组，None表示根据当前WHERE条件判断，无法判断时移除整张表
+        :return: void
+        """
+        table = self.__tablePrefix + self.__tableName
+        if table not in self.__identity:
+            return
+        pk = self.__primary_key()
+        if values is None and pk is not None and len(self.__whereParams) == 1:
+            if re.match(r"^\s*`?" + re.escape(pk) + r"`?\s*=\s*%s\s*$", self.__where):
+                values = self.__whereParams
+        if values is None:
+            del self.__identity[table]
+        else:
+            for value in values:
+                self.__identity[table].pop(self.__identity_key(value), None)
+
+    @staticmethod
+    def __identity_key(value):
+        """
+        标识映射中使用的主键值，整数与字符串统一为字符串，使get(1)与get("1")对应同一条记录
+        :param value: 主键值
+        :return: 标识映射的键
+        """
+        if isinstance(value, (int, str)) and not isinstance(value, bool):
+            return str(value)
+        return value
+
+    def clear_identity(self):
+        """
+        清空标识映射，使用query()等方式直接修改数据后应调用
+        :return: void
+        """
+        self.__identity.clear()
+
+    def get(self, value):
+        """
+        根据主键获取单条记录，同一对象内重复获取直接返回标识映射中的记录
+        该方法忽略当前设置的查询条件
+        :param value: 主键值
+        :return: 记录或None
+        """
+        rows = self.__identity_rows()
+        key = self.__identity_key(value)
+        if key not in rows:
+            sql = "SELECT * FROM `" + self.__tablePrefix + self.__tableName + "` WHERE `" + self.__primary_key() + "`=%s LIMIT 1"
+            result = self.query(sql, [value])
+            if len(result) > 0:
+                rows[key] = result[0]
+        self.__clear_environment()
+        return rows.get(key)
+
+    def get_many(self, values, chunk=1000):
+        """
+        根据主键批量获取记录，仅对标识映射中不存在的主键使用IN查询
+        该方法忽略当前设置的查询条件
+        :param values: 主键值数组
+        :param chunk: 每次IN查询的最大主键数量
+        :return: dict 传入的主键值 => 记录，不存在的记录不包含在内
+        """
+        rows = self.__identity_rows()
+        pk = self.__primary_key()
+        missing = []
+        seen = set()
+        for value in values:
+            key = self.__identity_key(value)
+            if key not in rows and key not in seen:
+                seen.add(key)
+                missing.append(value)
+        for i in range(0, len(missing), chunk):
+            part = missing[i:i + chunk]
+            sql = "SELECT * FROM `" + self.__tablePrefix + self.__tableName + "` WHERE `" + pk + "` IN(" + ",".join(["%s" for value in part]) + ")"
+            for row in self.query(sql, part):
+                rows[self.__identity_key(row[pk])] = row
+        self.__clear_environment()
+        result = {}
+        for value in values:
+            key = self.__identity_key(value)
+            if key in rows:
+                result[value] = rows[key]
+        return result
+
+    def __build_count_sql(self):
+        """
+        根据当前条件构建去除ORDER BY及LIMIT的COUNT语句
+        :return: tuple (COUNT语句, 内层查询语句, 绑定参数)
+        """
+        if self.__union != "" or self.__having != "":
+            fields = self.__fields if self.__fields != "" else "*"
+        else:
+            fields = "1"
+        sql = "SELECT " + fields + " FROM `" + self.__tablePrefix + self.__tableName + "`"
+        if self.__alias != "":
+            sql += " AS " + self.__alias
+        if self.__join != "":
+            sql += " " + self.__join
+        if self.__where != "":
+            sql += " WHERE " + self.__where
+        if self.__group != "":
+            sql += " GROUP BY " + self.__group
+        if self.__having != "":
+            sql += " HAVING " + self.__having
+        sql += self.__union
+        params = list(self.__whereParams + self.__havingParams)
+        if self.__group == "" and self.__union == "" and self.__having == "":
+            count_sql = "SELECT COUNT(*) AS total" + sql[len("SELECT " + fields):]
+        else:
+            count_sql = "SELECT COUNT(*) AS total FROM (" + sql + ") AS fize_count"
+        return count_sql, sql, params
+
+    def __estimate_count(self, inner_sql, params, simple):
+        """
+        估算记录总数
+        无任何条件时使用information_schema中的表行数，否则使用EXPLAIN的扫描行数估算
+        :param inner_sql: 内层查询语句
+        :param params: 绑定参数
+        :param simple: 是否无任何条件
+        :return: int
+        """
+        if simple:
+            sql = "SELECT TABLE_ROWS AS total FROM information_schema.TABLES WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s"
+            rows = self.query(sql, [self.__tablePrefix + self.__tableName])
+            if len(rows) > 0 and rows[0]['total'] is not None:
+                return int(rows[0]['total'])
+            return 0
+        cursor, effect_row = self.__execute("EXPLAIN " + inner_sql, params, None, True)
+        plans = cursor.fetchall()
+        cursor.close()
+        if len(plans) == 0 or plans[0].get('rows') is None:
+            return 0
+        filtered = plans[0].get('filtered')
+        if filtered is None:
+            filtered = 100
+        return int(int(plans[0]['rows']) * float(filtered) / 100)
+
+    def paginate(self, index, size=10, count="exact", ttl=60, concurrent=True, fields=None):
+        """
+        分页查询并返回记录总数
+        :param index: 页码
+        :param size: 每页记录数量
+        :param count: 总数计算方式，exact为精确COUNT，estimate为估算值，cached为缓存ttl秒的精确COUNT
+        :param ttl: cached方式的缓存时间，单位秒
+        :param concurrent: 是否在旁路连接上与分页查询同时执行COUNT
+        :param fields: 要查询的字段，不指定则使用field()设置的字段
+        :return: dict 包含rows、total、page、size、pages
+        """
+        if count not in ("exact", "estimate", "cached"):
+            raise ValueError("不支持的count方式: " + str(count))
+        if fields is not None or self.__fields == "":
+            self.field(fields)
+        fields = self.__fields  # select()会重置字段，需显式传入
+        count_sql, inner_sql, params = self.__build_count_sql()
+        simple = self.__join == "" and self.__where == "" and self.__group == "" and self.__union == "" and self.__having == ""
+        cache_key = (self.__config['host'], self.__config['port'], self.__config['database'], count_sql, repr(params))
+        total = None
+        if count == "cached":
+            with OrmMysql.__count_cache_lock:
+                cached = OrmMysql.__count_cache.get(cache_key)
+            if cached is not None and cached[1] > time.monotonic():
+                total = cached[0]
+        if count == "estimate":
+            rows = self.page(index, size).select(fields)
+            total = self.__estimate_count(inner_sql, params, simple)
+        elif total is not None:
+            rows = self.page(index, size).select(fields)
+        elif concurrent:
+            if self.__aux is None:
+                self.__aux = self.clone()
+                # 旁路连接只执行COUNT且从不提交，关闭自动提交时REPEATABLE READ下会一直读取首次查询时的快照
+                self.__aux.prototype.autocommit(True)
+            result = {}
+
+            def run_count():
+                try:
+                    result['total'] = self.__aux.query(count_sql, params)[0]['total']
+                except Exception as e:
+                    result['error'] = e
+
+            worker = threading.Thread(target=run_count, name="fize-paginate-count", daemon=True)
+            worker.start()
+            try:
+                rows = self.page(index, size).select(fields)
+            finally:
+                worker.join()
+            if 'error' in result:
+                raise result['error']
+            total = result['total']
+        else:
+            rows = self.page(index, size).select(fields)
+            total = self.query(count_sql, params)[0]['total']
+        if count == "cached":
+            with OrmMysql.__count_cache_lock:
+                cache = OrmMysql.__count_cache
+                now = time.monotonic()
+                if cache_key not in cache or cache[cache_key][1] <= now:
+                    cache.pop(cache_key, None)
+                    if len(cache) >= OrmMysql.__count_cache_size:
+                        for key in [key for key, item in cache.items() if item[1] <= now]:
+                            del cache[key]
+                        while len(cache) >= OrmMysql.__count_cache_size:
+                            del cache[next(iter(cache))]
+                    cache[cache_key] = (total, now + ttl)
+        return {
+            'rows': rows,
+            'total': total,
+            'page': index,
+            'size': size,
+            'pages': (total + size - 1) // size
+        }
+
+    def __split_partitions(self, by, count, split, where, params):
+        """
+        将扫描字段的取值范围划分为若干分区
+        :param by: 扫描字段
+        :param count: 分区数量
+        :param split: 划分方式，range为按MIN/MAX等分(仅适用于整数字段)，sample为按索引采样等量划分
+        :param where: WHERE条件
+        :param params: WHERE条件绑定参数
+        :return: list 由(下界, 上界)组成的分区数组，左闭右开，None表示不限
+        """
+        table = "`" + self.__tablePrefix + self.__tableName + "`"
+        condition = " WHERE " + where if where != "" else ""
+        if split == "range":
+            rows = self.query("SELECT MIN(`" + by + "`) AS lo, MAX(`" + by + "`) AS hi FROM " + table + condition, list(params))
+            if len(rows) == 0 or rows[0]['lo'] is None:
+                return []
+            lo = int(rows[0]['lo'])
+            hi = int(rows[0]['hi']) + 1
+            step = max(1, (hi - lo + count - 1) // count)
+            partitions = []
+            for start in range(lo, hi, step):
+                partitions.append((start, min(start + step, hi)))
+            return partitions
+        elif split == "sample":
+            if where == "":
+                total = self.__estimate_count("", [], True)
+            else:
+                total = self.query("SELECT COUNT(*) AS total FROM " + table + condition, list(params))[0]['total']
+            bounds = [None]
+            for i in range(1, count):
+                sql = "SELECT `" + by + "` AS bound FROM " + table + condition + " ORDER BY `" + by + "` LIMIT 1 OFFSET " + str(total * i // count)
+                rows = self.query(sql, list(params))
+                if len(rows) > 0 and (bounds[-1] is None or rows[0]['bound'] > bounds[-1]):
+                    bounds.append(rows[0]['bound'])
+            bounds.append(None)
+            return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+        else:
+            raise ValueError("不支持的分区方式: " + str(split))
+
+    def parallel_scan(self, workers=4, by=None, batch=1000, ordered=False, partitions=None, split="range", fields=None, func=None, processes=None):
+        """
+        多连接并行全表扫描，按批次返回记录
+        将扫描字段的取值范围划分为多个分区，每个分区在线程池中使用独立连接以键集分页方式读取
+        :param workers: 并行读取的线程(连接)数
+        :param by: 扫描字段，需有索引且值唯一，默认使用主键，未指定主键时为id
+        :param batch: 每批记录数
+        :param ordered: 是否按分区顺序返回批次，否则按到达顺序返回
+        :param partitions: 分区数量，默认为workers的4倍
+        :param split: 分区划分方式，range为按MIN/MAX等分，sample为按索引采样等量划分
+        :param fields: 要查询的字段，必须包含扫描字段
+        :param func: 对每批记录调用的处理函数，返回值代替记录批次返回，在读取线程中执行
+        :param processes: 指定时func在该数量的进程池中执行，用于CPU密集型处理，func必须可被pickle
+        :return: generator 记录批次或func的返回值
+        """
+        # 查询条件及分区在调用时立即确定，不等到首次迭代，以免期间的链式调用混入或清空条件
+        if by is None:
+            by = self.__primary_key() if self.__primary_key() is not None else "id"
+        if partitions is None:
+            partitions = workers * 4
+        if isinstance(fields, list):
+            if by not in fields:
+                fields = fields + [by]
+            fields = ",".join(fields)
+        if fields is None:
+            fields = "*"
+        where = self.__where
+        params = list(self.__whereParams)
+        self.__clear_environment()
+        ranges = self.__split_partitions(by, partitions, split, where, params)
+        if len(ranges) == 0:
+            return iter([])
+        template = self.clone()
+        table = "`" + self.__tablePrefix + self.__tableName + "`"
+        return self.__scan_partitions(template, table, ranges, by, where, params, fields, workers, batch, ordered, func, processes)
+
+    @staticmethod
+    def __scan_partitions(template, table, ranges, by, where, params, fields, workers, batch, ordered, func, processes):
+        """
+        并行读取各分区并按批次返回，参数含义同parallel_scan()
+        :param template: 用于创建各读取线程独立连接的ORM对象
+        :param table: 完整表名
+        :param ranges: 分区数组
+        :return: generator 记录批次或func的返回值
+        """
+        local = threading.local()
+        stop = threading.Event()
+        if ordered:
+            outputs = [queue.Queue(2) for part in ranges]
+        else:
+            shared = queue.Queue(workers * 2)
+            outputs = [shared for part in ranges]
+        pool = ProcessPoolExecutor(processes) if func is not None and processes else None
+
+        def emit(output, item):
+            while not stop.is_set():
+                try:
+                    output.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def scan(index):
+            output = outputs[index]
+            try:
+                if not hasattr(local, 'orm'):
+                    local.orm = template.clone()
+                lo, hi = ranges[index]
+                last = None
+                while not stop.is_set():
+                    conditions = []
+                    binds = []
+                    if lo is not None:
+                        conditions.append("`" + by + "`>=%s")
+                        binds.append(lo)
+                    if hi is not None:
+                        conditions.append("`" + by + "`<%s")
+                        binds.append(hi)
+                    if last is not None:
+                        conditions.append("`" + by + "`>%s")
+                        binds.append(last)
+                    if where != "":
+                        conditions.append("(" + where + ")")
+                        binds += params
+                    sql = "SELECT " + fields + " FROM " + table
+                    if len(conditions) > 0:
+                        sql += " WHERE " + " AND ".join(conditions)
+                    sql += " ORDER BY `" + by + "` LIMIT " + str(batch)
+                    rows = local.orm.query(sql, binds)
+                    if len(rows) == 0:
+                        break
+                    last = rows[-1][by]
+                    data = rows
+                    if func is not None:
+                        data = pool.submit(func, rows).result() if pool is not None else func(rows)
+                    if not emit(output, ('batch', data)):
+                        return
+                    if len(rows) < batch:
+                        break
+                emit(output, ('done', None))
+            except Exception as e:
+                emit(output, ('error', e))
+
+        executor = ThreadPoolExecutor(workers)
+        try:
+            for index in range(len(ranges)):
+                executor.submit(scan, index)
+            if ordered:
+                for output in outputs:
+                    while True:
+                        kind, data = output.get()
+                        if kind == 'done':
+                            break
+                        if kind == 'error':
+                            raise data
+                        yield data
+            else:
+                remaining = len(ranges)
+                while remaining > 0:
+                    kind, data = shared.get()
+                    if kind == 'done':
+                        remaining -= 1
+                    elif kind == 'error':
+                        raise data
+                    else:
+                        yield data
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+            if pool is not None:
+                pool.shutdown(wait=True)
+
     def select(self, fields=None):
         """
         执行查询，返回结果记录列表
@@ -638,8 +1481,11 @@ class OrmMysql:
         """
         self.field(fields)
         self.__build_sql("SELECT")
+        related = self.__related
         rows = self.query(self.__sql, self.__params)
         self.__clear_environment()
+        if len(related) > 0:
+            self.__load_related(rows, related)
         return rows
 
     def find(self, fields=None):
@@ -651,8 +1497,11 @@ class OrmMysql:
         self.field(fields)
         self.limit(1)
         self.__build_sql("SELECT")
+        related = self.__related
         rows = self.query(self.__sql, self.__params)
         self.__clear_environment()
+        if len(related) > 0:
+            self.__load_related(rows, related)
         if len(rows) > 0:
             return rows[0]
         else:
@@ -665,9 +1514,171 @@ class OrmMysql:
         """
         self.__build_sql("DELETE")
         effect_row = self.query(self.__sql, self.__params)
+        self.__evict_identity()
         self.__clear_environment()
         return effect_row
 
+    @staticmethod
+    def __replica_lag(replica):
+        """
+        获取从库复制延迟
+        :param replica: 从库的OrmMysql对象或原生连接
+        :return: int 延迟秒数，无法获取时返回None
+        """
+        conn = replica.prototype if isinstance(replica, OrmMysql) else replica
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute("SHOW SLAVE STATUS")
+        row = cursor.fetchone()
+        cursor.close()
+        if row is None:
+            return None
+        if 'Seconds_Behind_Master' in row:
+            return row['Seconds_Behind_Master']
+        return row.get('Seconds_Behind_Source')
+
+    def __throttle(self, elapsed, sleep, duty_cycle, max_lag, replica):
+        """
+        分批操作之间的限流等待
+        :param elapsed: 上一批的执行耗时
+        :param sleep: 固定等待时间
+        :param duty_cycle: 目标占空比
+        :param max_lag: 允许的最大从库延迟
+        :param replica: 从库
+        :return: void
+        """
+        pause = sleep
+        if duty_cycle is not None and 0 < duty_cycle < 1:
+            pause = max(pause, elapsed * (1 - duty_cycle) / duty_cycle)
+        if pause > 0:
+            time.sleep(pause)
+        if max_lag is not None and replica is not None:
+            lag = self.__replica_lag(replica)
+            while lag is not None and lag > max_lag:
+                time.sleep(1)
+                lag = self.__replica_lag(replica)
+
+    def __run_chunks(self, build, batch, by, sleep, duty_cycle, max_lag, replica, progress):
+        """
+        分批执行语句直到完成，每批在各自的短事务中提交
+        :param build: 根据分批条件及其绑定参数构建(语句, 绑定参数)的函数
+        :param batch: 每批记录数
+        :param by: 键范围分批使用的字段，None表示使用LIMIT分批直到无受影响记录
+        :return: int 受影响记录总数
+        """
+        table = "`" + self.__tablePrefix + self.__tableName + "`"
+        pk = self.__primary_key()
+        where = self.__where
+        params = list(self.__whereParams)
+        self.__evict_identity()
+        self.__clear_environment()
+        total = 0
+        if by is None:
+            while True:
+                conditions = ["(" + where + ")"] if where != "" else []
+                sql, binds = build(conditions, list(params))
+                start = time.monotonic()
+                effect_row = self.query(sql + " LIMIT " + str(batch), binds)
+                total += effect_row
+                if progress is not None:
+                    progress(total, effect_row)
+                if effect_row == 0:
+                    break
+                self.__throttle(time.monotonic() - start, sleep, duty_cycle, max_lag, replica)
+            return total
+        # 分批键必须唯一，否则同一值的记录超过batch条时区间为空且无法前进，因此附加主键组成(by, 主键)
+        keys = [by] if pk is None or pk == by else [by, pk]
+        fields = ",".join(["`" + key + "`" for key in keys])
+        if len(keys) > 1:
+            column = "(" + fields + ")"
+            holder = "(" + ",".join(["%s"] * len(keys)) + ")"
+        else:
+            column = fields
+            holder = "%s"
+        condition = " WHERE (" + where + ")" if where != "" else ""
+        rows = self.query("SELECT " + fields + " FROM " + table + condition + " ORDER BY " + fields + " LIMIT 1", list(params))
+        lo = [rows[0][key] for key in keys] if len(rows) > 0 else None
+        while lo is not None:
+            sql = "SELECT " + fields + " FROM " + table + " WHERE " + column + ">=" + holder
+            if where != "":
+                sql += " AND (" + where + ")"
+            sql += " ORDER BY " + fields + " LIMIT 1 OFFSET " + str(batch)
+            rows = self.query(sql, lo + params)
+            hi = [rows[0][key] for key in keys] if len(rows) > 0 else None
+            if hi == lo:
+                raise ValueError("分批字段" + by + "的值不唯一，请使用唯一字段或为表指定主键")
+            conditions = [column + ">=" + holder]
+            binds = list(lo)
+            if hi is not None:
+                conditions.append(column + "<" + holder)
+                binds += hi
+            if where != "":
+                conditions.append("(" + where + ")")
+                binds += params
+            sql, binds = build(conditions, binds)
+            start = time.monotonic()
+            effect_row = self.query(sql, binds)
+            total += effect_row
+            if progress is not None:
+                progress(total, effect_row)
+            lo = hi
+            if lo is not None:
+                self.__throttle(time.monotonic() - start, sleep, duty_cycle, max_lag, replica)
+        return total
+
+    def delete_in_chunks(self, batch=5000, sleep=0, by=None, duty_cycle=None, max_lag=None, replica=None, progress=None):
+        """
+        按当前WHERE条件分批删除记录，每批使用独立的短事务，避免长时间持有行锁及复制延迟
+        :param batch: 每批删除的记录数
+        :param sleep: 每批之间的固定等待时间，单位秒
+        :param by: 按该字段(需有索引)的键范围分批，分批键必须唯一：字段值不唯一时自动附加主键按(by, 主键)分批，未指定主键时by本身必须唯一，None表示重复执行DELETE ... LIMIT直到无受影响记录
+        :param duty_cycle: 目标占空比(0~1)，如0.5表示等待时间与执行时间相同
+        :param max_lag: 允许的最大从库延迟，单位秒，超过时暂停
+        :param replica: 用于检查复制延迟的从库OrmMysql对象或原生连接
+        :param progress: 进度回调，参数为(已删除总数, 本批删除数)
+        :return: int 删除记录总数
+        """
+        pk = self.__primary_key()
+
+        def build(conditions, binds):
+            sql = "DELETE FROM `" + self.__tablePrefix + self.__tableName + "`"
+            if len(conditions) > 0:
+                sql += " WHERE " + " AND ".join(conditions)
+            if by is None and pk is not None:
+                sql += " ORDER BY `" + pk + "`"
+            return sql, binds
+
+        return self.__run_chunks(build, batch, by, sleep, duty_cycle, max_lag, replica, progress)
+
+    def update_in_chunks(self, datadict, batch=5000, sleep=0, by=None, duty_cycle=None, max_lag=None, replica=None, progress=None):
+        """
+        按当前WHERE条件以键范围分批更新记录，每批使用独立的短事务
+        :param datadict: 要设置的数据
+        :param batch: 每批更新的记录数
+        :param sleep: 每批之间的固定等待时间，单位秒
+        :param by: 分批使用的字段(需有索引)，默认使用主键，未指定主键时为id，分批键必须唯一：字段值不唯一时自动附加主键按(by, 主键)分批，未指定主键时by本身必须唯一
+        :param duty_cycle: 目标占空比(0~1)
+        :param max_lag: 允许的最大从库延迟，单位秒，超过时暂停
+        :param replica: 用于检查复制延迟的从库OrmMysql对象或原生连接
+        :param progress: 进度回调，参数为(已更新总数, 本批更新数)
+        :return: int 更新记录总数
+        """
+        if by is None:
+            by = self.__primary_key() if self.__primary_key() is not None else "id"
+        datadict = self.__prepare(datadict)
+        parts = []
+        values = []
+        for key, val in datadict.items():
+            parts.append("`" + key + "`=%s")
+            values.append(val)
+
+        def build(conditions, binds):
+            sql = "UPDATE `" + self.__tablePrefix + self.__tableName + "` SET " + ",".join(parts)
+            if len(conditions) > 0:
+                sql += " WHERE " + " AND ".join(conditions)
+            return sql, values + binds
+
+        return self.__run_chunks(build, batch, by, sleep, duty_cycle, max_lag, replica, progress)
+
     def truncate(self):
         """
         清空记录
@@ -675,6 +1686,7 @@ class OrmMysql:
         """
         self.__build_sql("TRUNCATE")
         effect_row = self.query(self.__sql)
+        self.__identity.pop(self.__tablePrefix + self.__tableName, None)
         self.__clear_environment()
 
     def update(self, datadict):
@@ -685,5 +1697,530 @@ class OrmMysql:
         """
         self.__build_sql("UPDATE", datadict)
         effect_row = self.query(self.__sql, self.__params)
+        self.__evict_identity()
         self.__clear_environment()
         return effect_row
+
+
+class BatchWriter:
+    """
+    批量写入器
+    将单条记录放入有界队列后立即返回，由后台线程合并为多行INSERT语句写入，
+    在达到批量大小、超过最长等待时间或显式调用flush()时写入，进程退出时写完队列中剩余的记录。
+    """
+
+    __FLUSH = object()
+
+    __STOP = object()
+
+    def __init__(self, orm, size=500, interval=1.0, maxsize=10000, retries=3, retry_delay=0.5, on_error=None):
+        """
+        初始化
+        :param orm: 已指定表的ORM对象，写入器独占该对象的连接，建议使用OrmMysql.batch_writer()创建
+        :param size: 每批最多合并的记录数
+        :param interval: 记录在缓冲区中的最长等待时间，单位秒
+        :param maxsize: 队列最大长度，队列满时add()将阻塞(背压)
+        :param retries: 批量写入失败时的重试次数
+        :param retry_delay: 重试间隔，单位秒，每次重试翻倍
+        :param on_error: 重试全部失败后的回调，参数为(记录数组, 异常)，不指定则记录保存在failed中
+        """
+        self.__orm = orm
+        self.__size = size
+        self.__interval = interval
+        self.__retries = retries
+        self.__retry_delay = retry_delay
+        self.__on_error = on_error
+        self.__queue = queue.Queue(maxsize)
+        self.__closed = False
+        self.failed = []
+        self.written = 0
+        self.__thread = threading.Thread(target=self.__run, name="fize-batch-writer", daemon=True)
+        self.__thread.start()
+        atexit.register(self.close)
+
+    def add(self, datadict, block=True, timeout=None):
+        """
+        添加一条记录，不等待写入
+        :param datadict: 数据词典
+        :param block: 队列已满时是否阻塞等待
+        :param timeout: 阻塞等待的最长时间，超时抛出queue.Full
+        :return: void
+        """
+        if self.__closed or not self.__thread.is_alive():
+            raise RuntimeError("BatchWriter已关闭")
+        self.__queue.put(datadict, block, timeout)
+
+    def flush(self, timeout=None):
+        """
+        将调用前添加的记录全部写入后返回，已关闭时等待后台线程写完剩余记录
+        :param timeout: 最长等待时间
+        :return: bool 是否在超时前完成
+        """
+        if self.__closed:
+            self.__thread.join(timeout)
+            return not self.__thread.is_alive()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        event = threading.Event()
+        try:
+            self.__queue.put((self.__FLUSH, event), True, timeout)
+        except queue.Full:
+            return False
+        while not event.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                return False
+            if not event.wait(wait) and not self.__thread.is_alive():  # 并发调用close()时标记可能排在结束标记之后
+                return event.is_set()
+        return True
+
+    def close(self, timeout=None):
+        """
+        写完队列中剩余的记录后停止后台线程
+        :param timeout: 最长等待时间
+        :return: void
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__queue.put((self.__STOP, None))
+        self.__thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __run(self):
+        """
+        后台线程主循环
+        :return: void
+        """
+        buffer = []
+        deadline = None
+        while True:
+            if deadline is None:
+                wait = None
+            else:
+                wait = max(0, deadline - time.monotonic())
+            try:
+                item = self.__queue.get(timeout=wait)
+            except queue.Empty:
+                self.__write(buffer)
+                buffer = []
+                deadline = None
+                continue
+            if isinstance(item, tuple) and len(item) == 2 and item[0] in (self.__FLUSH, self.__STOP):
+                self.__write(buffer)
+                buffer = []
+                deadline = None
+                if item[0] is self.__STOP:
+                    self.__drain()
+                    return
+                item[1].set()
+                continue
+            buffer.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.__interval
+            if len(buffer) >= self.__size:
+                self.__write(buffer)
+                buffer = []
+                deadline = None
+
+    def __drain(self):
+        """
+        写入结束标记之后仍进入队列的记录，并唤醒等待中的flush()
+        :return: void
+        """
+        buffer = []
+        events = []
+        while True:
+            try:
+                item = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple) and len(item) == 2 and item[0] in (self.__FLUSH, self.__STOP):
+                if item[1] is not None:
+                    events.append(item[1])
+            else:
+                buffer.append(item)
+        self.__write(buffer)
+        for event in events:
+            event.set()
+
+    def __write(self, buffer):
+        """
+        按键名分组后写入一批记录，失败时重试
+        :param buffer: 记录数组
+        :return: void
+        """
+        groups = {}
+        for datadict in buffer:
+            groups.setdefault(tuple(sorted(datadict.keys())), []).append(datadict)
+        for rows in groups.values():
+            delay = self.__retry_delay
+            attempt = 0
+            while True:
+                try:
+                    self.written += self.__orm.add_all(rows)
+                    break
+                except Exception as e:
+                    try:
+                        self.__orm.prototype.rollback()
+                        self.__orm.prototype.ping(reconnect=True)
+                    except Exception:
+                        pass
+                    attempt += 1
+                    if attempt > self.__retries:
+                        if self.__on_error is None:
+                            self.failed.append((rows, e))
+                            break
+                        try:
+                            self.__on_error(rows, e)
+                        except Exception:  # 回调异常不能终止后台线程，否则队列满后add()将一直阻塞
+                            self.failed.append((rows, e))
+                        break
+                    time.sleep(delay)
+                    delay *= 2
+
+
+class TableMirror:
+    """
+    小表内存镜像
+    将字典表、配置表等小表整表加载到内存，按主键及指定字段建立索引，
+    后台线程根据版本字段(如updated_at)增量刷新，get/filter查询不访问数据库。
+    """
+
+    def __init__(self, orm, table, pk="id", indexes=None, version="updated_at", interval=30, full_interval=None, autostart=True):
+        """
+        初始化并加载整表
+        :param orm: 镜像独占使用的ORM对象，建议使用OrmMysql.mirror()创建
+        :param table: 完整表名(含前缀)
+        :param pk: 主键字段名
+        :param indexes: 需要建立索引的字段数组
+        :param version: 版本字段名，每次刷新仅读取该字段不小于上次最大值的记录，None表示每次刷新均整表加载
+        :param interval: 后台刷新间隔，单位秒
+        :param full_interval: 整表重新加载的间隔(用于感知删除)，默认为interval的10倍
+        :param autostart: 是否立即启动后台刷新线程
+        """
+        self.__orm = orm
+        # 镜像连接只执行SELECT且从不提交，关闭自动提交时REPEATABLE READ下每次刷新都会读取首次查询时的快照
+        orm.prototype.autocommit(True)
+        self.__table = table
+        self.__pk = pk
+        self.__indexes = list(indexes) if indexes is not None else []
+        self.__version = version
+        self.__interval = interval
+        self.__full_interval = full_interval if full_interval is not None else interval * 10
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__rows = {}
+        self.__index = {}
+        self.__max_version = None
+        self.__loaded_at = None
+        self.__refreshed_at = None
+        self.__refreshes = 0
+        self.__errors = 0
+        self.last_error = None
+        self.reload()
+        if autostart:
+            self.start()
+
+    def __build_index(self, rows):
+        """
+        根据主键词典构建字段索引
+        :param rows: dict 主键值 => 记录
+        :return: dict 字段名 => {值 => 记录数组}
+        """
+        index = {}
+        for column in self.__indexes:
+            index[column] = {}
+        for row in rows.values():
+            for column in self.__indexes:
+                index[column].setdefault(row.get(column), []).append(row)
+        return index
+
+    def __track_version(self, rows):
+        """
+        更新已加载记录中版本字段的最大值
+        :param rows: 记录数组
+        :return: void
+        """
+        if self.__version is None:
+            return
+        for row in rows:
+            value = row.get(self.__version)
+            if value is not None and (self.__max_version is None or value > self.__max_version):
+                self.__max_version = value
+
+    def reload(self):
+        """
+        整表重新加载
+        :return: void
+        """
+        result = self.__orm.query("SELECT * FROM `" + self.__table + "`")
+        rows = {}
+        for row in result:
+            rows[row[self.__pk]] = row
+        index = self.__build_index(rows)
+        with self.__lock:
+            self.__rows = rows
+            self.__index = index
+            self.__max_version = None
+            self.__track_version(result)
+            self.__loaded_at = time.time()
+            self.__refreshed_at = self.__loaded_at
+
+    def refresh(self):
+        """
+        增量刷新，未指定版本字段或到达整表加载间隔时整表重新加载
+        :return: int 变更的记录数
+        """
+        if self.__version is None or self.__max_version is None or time.time() - self.__loaded_at >= self.__full_interval:
+            self.reload()
+            return len(self.__rows)
+        sql = "SELECT * FROM `" + self.__table + "` WHERE `" + self.__version + "`>=%s"
+        result = self.__orm.query(sql, [self.__max_version])
+        changed = [row for row in result if self.__rows.get(row[self.__pk]) != row]
+        if len(changed) > 0:
+            rows = dict(self.__rows)
+            for row in changed:
+                rows[row[self.__pk]] = row
+            index = self.__build_index(rows)
+            with self.__lock:
+                self.__rows = rows
+                self.__index = index
+        with self.__lock:
+            self.__track_version(result)
+            self.__refreshed_at = time.time()
+        return len(changed)
+
+    def __run(self):
+        """
+        后台刷新线程主循环
+        :return: void
+        """
+        while not self.__stop.wait(self.__interval):
+            try:
+                self.refresh()
+                self.__refreshes += 1
+            except Exception as e:
+                self.__errors += 1
+                self.last_error = e
+
+    def start(self):
+        """
+        启动后台刷新线程
+        :return: void
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name="fize-table-mirror", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        停止后台刷新线程
+        :return: void
+        """
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def get(self, pk, default=None):
+        """
+        根据主键获取记录，返回的记录为镜像共享对象，请勿修改
+        :param pk: 主键值
+        :param default: 记录不存在时的返回值
+        :return: dict
+        """
+        return self.__rows.get(pk, default)
+
+    def filter(self, **conditions):
+        """
+        获取各字段值均相等的记录数组，条件中包含索引字段时使用索引
+        :param conditions: 字段名 => 值
+        :return: list
+        """
+        rows = self.__rows
+        index = self.__index
+        candidates = None
+        for column, value in conditions.items():
+            if column == self.__pk:
+                row = rows.get(value)
+                candidates = [row] if row is not None else []
+                break
+            if column in index:
+                candidates = index[column].get(value, [])
+                break
+        if candidates is None:
+            candidates = rows.values()
+        result = []
+        for row in candidates:
+            matched = True
+            for column, value in conditions.items():
+                if row.get(column) != value:
+                    matched = False
+                    break
+            if matched:
+                result.append(row)
+        return result
+
+    def all(self):
+        """
+        获取全部记录
+        :return: list
+        """
+        return list(self.__rows.values())
+
+    def __len__(self):
+        return len(self.__rows)
+
+    def stats(self):
+        """
+        获取镜像的记录数、估算内存占用及数据陈旧程度
+        :return: dict
+        """
+        rows = self.__rows
+        size = sys.getsizeof(rows)
+        for row in rows.values():
+            size += sys.getsizeof(row)
+            for value in row.values():
+                size += sys.getsizeof(value)
+        now = time.time()
+        return {
+            'rows': len(rows),
+            'bytes': size,
+            'loaded_at': self.__loaded_at,
+            'refreshed_at': self.__refreshed_at,
+            'staleness': now - self.__refreshed_at if self.__refreshed_at is not None else None,
+            'refreshes': self.__refreshes,
+            'errors': self.__errors,
+            'last_error': self.last_error
+        }
+
+
+class PipelineResult:
+    """
+    管道中单条语句的执行结果
+    """
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.done = False
+        self.error = None
+        self.__value = None
+
+    def set(self, value=None, error=None):
+        """
+        设置执行结果
+        :param value: 结果值
+        :param error: 异常
+        :return: void
+        """
+        self.__value = value
+        self.error = error
+        self.done = True
+
+    @property
+    def value(self):
+        """
+        执行结果，与query()的返回值一致，语句执行失败时抛出对应异常
+        :return: mixed
+        """
+        if not self.done:
+            raise PipelineError("管道尚未执行")
+        if self.error is not None:
+            raise self.error
+        return self.__value
+
+
+class Pipeline:
+    """
+    语句管道
+    将多条相互独立的语句合并为一个多语句数据包发送，只需一次网络往返，再按顺序把各结果集分发给对应的语句。
+    与query()一致，每条语句执行成功即生效；某条语句失败时服务端不再执行后续语句。
+    """
+
+    __READS = ("SELECT", "SHOW", "DESC", "EXPLAIN")
+
+    def __init__(self, conn, limiter=None, on_write=None):
+        """
+        初始化
+        :param conn: 开启CLIENT_MULTI_STATEMENTS的原生连接
+        :param limiter: 并发限制器
+        :param on_write: 执行后的回调，参数为本次发送的写语句数组，没有写语句时不调用
+        """
+        self.__conn = conn
+        self.__limiter = limiter
+        self.__on_write = on_write
+        self.__statements = []
+
+    def query(self, sql, params=None):
+        """
+        向管道添加一条语句
+        :param sql: SQL语句，支持%s占位符预处理，也可以传入OrmMysql.build()的返回值
+        :param params: 可选的绑定参数
+        :return: PipelineResult
+        """
+        if isinstance(sql, tuple):
+            sql, params = sql
+        result = PipelineResult(sql)
+        self.__statements.append((sql, params, result))
+        return result
+
+    def __len__(self):
+        return len(self.__statements)
+
+    def execute(self):
+        """
+        一次发送全部语句并分发结果
+        :return: list 各语句的PipelineResult
+        """
+        statements = self.__statements
+        self.__statements = []
+        if len(statements) == 0:
+            return []
+        if self.__limiter is not None:
+            self.__limiter.acquire()
+        try:
+            cursor = self.__conn.cursor(pymysql.cursors.DictCursor)
+            packet = ";\n".join([cursor.mogrify(sql.rstrip().rstrip(";"), params) for sql, params, result in statements])
+            index = 0
+            try:
+                cursor.execute(packet)
+                while True:
+                    sql, params, result = statements[index]
+                    if sql[:6].upper() == "SELECT":
+                        result.set(cursor.fetchall())
+                    elif sql[:6].upper() == "INSERT" or sql[:7].upper() == "REPLACE":
+                        result.set(cursor.lastrowid)
+                    else:
+                        result.set(cursor.rowcount)
+                    index += 1
+                    if index >= len(statements) or not cursor.nextset():
+                        break
+            except pymysql.err.MySQLError as e:
+                statements[index][2].set(error=e)
+                for sql, params, result in statements[index + 1:]:
+                    result.set(error=PipelineError("前序语句执行失败，未执行: " + sql))
+            cursor.close()
+            self.__conn.commit()
+        finally:
+            if self.__limiter is not None:
+                self.__limiter.release()
+            if self.__on_write is not None:
+                writes = [sql for sql, params, result in statements if not sql.lstrip().upper().startswith(self.__READS)]
+                if writes:
+                    self.__on_write(writes)
+        return [result for sql, params, result in statements]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
@@ -1,110 +1,3074 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import os
 import datetime
+import hashlib
+import json
+import math
+import mmap
 import pickle
+import random
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.8以下
+    shared_memory = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    跨进程的文件咨询锁，Unix下使用flock，Windows下使用msvcrt.locking
+    """
+
+    def __init__(self, path):
+        """
+        初始化
+        :param path: 锁文件路径
+        """
+        self.__path = path
+        self.__fd = None
+
+    def acquire(self):
+        """
+        获取锁，阻塞直到成功
+        :return: void
+        """
+        while True:
+            try:
+                fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o644)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+                fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            except Exception:
+                os.close(fd)
+                raise
+            if fcntl is None or self.__same(fd, self.__path):
+                break
+            os.close(fd)  # 等待期间锁文件已被discard()删除，重新打开
+        self.__fd = fd
+
+    @staticmethod
+    def __same(fd, path):
+        """
+        判断已打开的文件是否仍是path指向的文件
+        :param fd: 文件描述符
+        :param path: 文件路径
+        :return: bool
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        fst = os.fstat(fd)
+        return (st.st_ino, st.st_dev) == (fst.st_ino, fst.st_dev)
+
+    @classmethod
+    def discard(cls, path):
+        """
+        在锁未被持有时删除锁文件，正在等待该锁的进程获取后会重新打开新的锁文件
+        :param path: 锁文件路径
+        :return: bool 是否已删除
+        """
+        if fcntl is None:  # Windows下仍被打开的文件无法删除，删除成功即说明没有持有者
+            os.remove(path)
+            return True
+        fd = os.open(path, os.O_RDWR)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            if not cls.__same(fd, path):
+                return False
+            os.remove(path)
+            return True
+        finally:
+            os.close(fd)
+
+    def release(self):
+        """
+        释放锁
+        :return: void
+        """
+        if self.__fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.__fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.__fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.__fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class MemoryCache:
+    """
+    进程内内存缓存
+    按条目数及估算字节数限制容量，支持LRU(最近最少使用)及LFU(最不经常使用)淘汰，遵循条目的过期时间。
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, policy="lru"):
+        """
+        初始化
+        :param max_entries: 最大条目数
+        :param max_bytes: 最大估算字节数，None表示不限制
+        :param policy: 淘汰策略，lru或lfu
+        """
+        if policy not in ("lru", "lfu"):
+            raise ValueError("不支持的淘汰策略: " + str(policy))
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__policy = policy
+        self.__lock = threading.Lock()
+        self.__entries = {}  # 键名 => [值, 过期时间戳, 估算字节数, 访问频次]
+        self.__order = OrderedDict()  # LRU访问顺序
+        self.__buckets = {}  # LFU访问频次 => OrderedDict
+        self.__min_freq = 0
+        self.__bytes = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def bytes(self):
+        """
+        当前估算占用字节数
+        :return: int
+        """
+        return self.__bytes
+
+    def __touch(self, key, entry):
+        """
+        记录一次访问
+        :param key: 键名
+        :param entry: 条目
+        :return: void
+        """
+        if self.__policy == "lru":
+            self.__order.move_to_end(key)
+            return
+        freq = entry[3]
+        bucket = self.__buckets[freq]
+        del bucket[key]
+        if len(bucket) == 0:
+            del self.__buckets[freq]
+            if self.__min_freq == freq:
+                self.__min_freq = freq + 1
+        entry[3] = freq + 1
+        self.__buckets.setdefault(freq + 1, OrderedDict())[key] = True
+
+    def __discard(self, key):
+        """
+        移除条目
+        :param key: 键名
+        :return: void
+        """
+        entry = self.__entries.pop(key)
+        self.__bytes -= entry[2]
+        if self.__policy == "lru":
+            del self.__order[key]
+        else:
+            bucket = self.__buckets[entry[3]]
+            del bucket[key]
+            if len(bucket) == 0:
+                del self.__buckets[entry[3]]
+
+    def __evict(self):
+        """
+        超出容量时淘汰条目
+        :return: void
+        """
+        while len(self.__entries) > 0 and (len(self.__entries) > self.__max_entries or (self.__max_bytes is not None and self.__bytes > self.__max_bytes)):
+            if self.__policy == "lru":
+                key = next(iter(self.__order))
+            else:
+                if self.__min_freq not in self.__buckets:
+                    self.__min_freq = min(self.__buckets)
+                key = next(iter(self.__buckets[self.__min_freq]))
+            self.__discard(key)
+
+    def get(self, key, default=None):
+        """
+        获取一个缓存值
+        :param key: 键名
+        :param default: 不存在或已过期时的返回值
+        :return: mixed
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] <= time.time():
+                self.__discard(key)
+                return default
+            self.__touch(key, entry)
+            return entry[0]
+
+    def set(self, key, val, expiry=None, size=0):
+        """
+        设置一个缓存值
+        :param key: 键名
+        :param val: 值
+        :param expiry: 过期时间戳，None表示永久有效
+        :param size: 估算字节数
+        :return: void
+        """
+        with self.__lock:
+            if key in self.__entries:
+                self.__discard(key)
+            self.__entries[key] = [val, expiry, size, 1]
+            self.__bytes += size
+            if self.__policy == "lru":
+                self.__order[key] = True
+            else:
+                self.__buckets.setdefault(1, OrderedDict())[key] = True
+                self.__min_freq = 1
+            self.__evict()
+
+    def remove(self, key):
+        """
+        删除一个缓存值
+        :param key: 键名
+        :return: void
+        """
+        with self.__lock:
+            if key in self.__entries:
+                self.__discard(key)
+
+    def keys(self):
+        """
+        获取全部键名，按淘汰顺序排列，最先被淘汰的在前
+        :return: list
+        """
+        with self.__lock:
+            if self.__policy == "lru":
+                return list(self.__order)
+            return [key for freq in sorted(self.__buckets) for key in self.__buckets[freq]]
+
+    def clear(self):
+        """
+        清空内存缓存
+        :return: void
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__order.clear()
+            self.__buckets.clear()
+            self.__min_freq = 0
+            self.__bytes = 0
+
+
+class CacheMetrics:
+    """
+    缓存运行指标
+    按操作及键名命名空间(键名中第一个分隔符之前的部分)统计命中、未命中、过期次数、读写字节数及耗时分布，
+    可导出为词典或Prometheus文本格式；可选记录逐键访问轨迹，用于回放评估内存缓存层的容量。
+    """
+
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float("inf"))
+
+    def __init__(self, separator=":", trace=None):
+        """
+        初始化
+        :param separator: 命名空间分隔符，键名不含分隔符时命名空间为default
+        :param trace: 访问轨迹，文件路径(每行“时间戳\\t操作\\t键名”)或带append方法的对象，None表示不记录
+        """
+        self.__separator = separator
+        self.__lock = threading.Lock()
+        self.__trace = trace
+        self.__trace_file = None
+        if isinstance(trace, str):
+            self.__trace_file = open(trace, 'a', encoding="utf-8")
+        self.reset()
+
+    def reset(self):
+        """
+        清零全部指标
+        :return: void
+        """
+        with self.__lock:
+            self.__operations = {}  # (操作, 命名空间, 结果) => 次数
+            self.__latency = {}  # (操作, 命名空间) => [各区间次数, 总耗时, 总次数]
+            self.__expired = {}  # 命名空间 => 次数
+            self.__bytes = {}  # (方向, 命名空间) => 字节数
+
+    def namespace(self, key):
+        """
+        获取键名所属的命名空间
+        :param key: cache键名
+        :return: str
+        """
+        position = key.find(self.__separator)
+        if position <= 0:
+            return "default"
+        return key[:position]
+
+    def record(self, op, key, result, seconds, count=1):
+        """
+        记录一次操作
+        :param op: 操作名称
+        :param key: cache键名，批量操作时为首个键名
+        :param result: 结果，hit、miss或ok
+        :param seconds: 耗时，单位秒
+        :param count: 计入结果的次数，批量操作已逐键计数时为0
+        :return: void
+        """
+        namespace = self.namespace(key)
+        with self.__lock:
+            if count > 0:
+                name = (op, namespace, result)
+                self.__operations[name] = self.__operations.get(name, 0) + count
+            histogram = self.__latency.get((op, namespace))
+            if histogram is None:
+                histogram = [[0] * len(self.BUCKETS), 0.0, 0]
+                self.__latency[(op, namespace)] = histogram
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+        if self.__trace is not None and count > 0:
+            self.__record_trace(op, key)
+
+    def count(self, op, key, result, count=1):
+        """
+        只计数不记录耗时，用于批量操作中逐键统计命中情况
+        :param op: 操作名称
+        :param key: cache键名
+        :param result: 结果
+        :param count: 次数
+        :return: void
+        """
+        name = (op, self.namespace(key), result)
+        with self.__lock:
+            self.__operations[name] = self.__operations.get(name, 0) + count
+        if self.__trace is not None:
+            self.__record_trace(op, key)
+
+    def expired(self, key):
+        """
+        记录一次读取时发现的过期条目
+        :param key: cache键名
+        :return: void
+        """
+        namespace = self.namespace(key)
+        with self.__lock:
+            self.__expired[namespace] = self.__expired.get(namespace, 0) + 1
+
+    def transferred(self, direction, key, nbytes):
+        """
+        记录读写的字节数
+        :param direction: read或write
+        :param key: cache键名
+        :param nbytes: 字节数
+        :return: void
+        """
+        name = (direction, self.namespace(key))
+        with self.__lock:
+            self.__bytes[name] = self.__bytes.get(name, 0) + nbytes
+
+    def __record_trace(self, op, key):
+        """
+        追加一条访问轨迹
+        :param op: 操作名称
+        :param key: cache键名
+        :return: void
+        """
+        if self.__trace_file is not None:
+            line = repr(time.time()) + "\t" + op + "\t" + key.replace("\n", " ") + "\n"
+            with self.__lock:
+                self.__trace_file.write(line)
+        else:
+            self.__trace.append((time.time(), op, key))
+
+    def close(self):
+        """
+        关闭访问轨迹文件
+        :return: void
+        """
+        if self.__trace_file is not None:
+            with self.__lock:
+                self.__trace_file.close()
+            self.__trace_file = None
+            self.__trace = None
+
+    def snapshot(self):
+        """
+        获取当前指标的快照
+        :return: dict
+        """
+        with self.__lock:
+            operations = {}
+            for (op, namespace, result), count in self.__operations.items():
+                item = operations.setdefault(op, {}).setdefault(namespace, {'hit': 0, 'miss': 0, 'ok': 0})
+                item[result] = item.get(result, 0) + count
+            for op, namespaces in operations.items():
+                for namespace, item in namespaces.items():
+                    lookups = item['hit'] + item['miss']
+                    item['hit_ratio'] = item['hit'] / lookups if lookups > 0 else None
+            latency = {}
+            for (op, namespace), (buckets, total, count) in self.__latency.items():
+                latency.setdefault(op, {})[namespace] = {
+                    'buckets': dict(zip(self.BUCKETS, buckets)),
+                    'sum': total,
+                    'count': count,
+                    'avg': total / count if count > 0 else None
+                }
+            byte_counts = {}
+            for (direction, namespace), nbytes in self.__bytes.items():
+                byte_counts.setdefault(direction, {})[namespace] = nbytes
+            return {
+                'operations': operations,
+                'latency': latency,
+                'expired': dict(self.__expired),
+                'bytes': byte_counts
+            }
+
+    @staticmethod
+    def __labels(**labels):
+        """
+        生成Prometheus标签文本
+        :param labels: 标签
+        :return: str
+        """
+        items = []
+        for name, value in labels.items():
+            value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+            items.append(name + "=\"" + value + "\"")
+        return "{" + ",".join(items) + "}"
+
+    def prometheus(self, gauges=None):
+        """
+        导出为Prometheus文本格式
+        :param gauges: 附加的存量指标，dict 层级 => {'entries': 条目数, 'bytes': 字节数}
+        :return: str
+        """
+        labels = self.__labels
+        with self.__lock:
+            operations = sorted(self.__operations.items())
+            latency = sorted(self.__latency.items())
+            expired = sorted(self.__expired.items())
+            byte_counts = sorted(self.__bytes.items())
+            latency = [(name, (list(buckets), total, count)) for name, (buckets, total, count) in latency]
+        lines = ["# HELP fize_cache_operations_total Cache operations by result.", "# TYPE fize_cache_operations_total counter"]
+        for (op, namespace, result), count in operations:
+            lines.append("fize_cache_operations_total" + labels(op=op, namespace=namespace, result=result) + " " + str(count))
+        lines.append("# HELP fize_cache_latency_seconds Cache operation latency.")
+        lines.append("# TYPE fize_cache_latency_seconds histogram")
+        for (op, namespace), (buckets, total, count) in latency:
+            cumulative = 0
+            for bound, hits in zip(self.BUCKETS, buckets):
+                cumulative += hits
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append("fize_cache_latency_seconds_bucket" + labels(op=op, namespace=namespace, le=le) + " " + str(cumulative))
+            lines.append("fize_cache_latency_seconds_sum" + labels(op=op, namespace=namespace) + " " + repr(total))
+            lines.append("fize_cache_latency_seconds_count" + labels(op=op, namespace=namespace) + " " + str(count))
+        lines.append("# HELP fize_cache_expired_total Expired entries found on read.")
+        lines.append("# TYPE fize_cache_expired_total counter")
+        for namespace, count in expired:
+            lines.append("fize_cache_expired_total" + labels(namespace=namespace) + " " + str(count))
+        lines.append("# HELP fize_cache_bytes_total Bytes read from and written to the cache files.")
+        lines.append("# TYPE fize_cache_bytes_total counter")
+        for (direction, namespace), nbytes in byte_counts:
+            lines.append("fize_cache_bytes_total" + labels(direction=direction, namespace=namespace) + " " + str(nbytes))
+        if gauges:
+            lines.append("# HELP fize_cache_entries Current number of entries.")
+            lines.append("# TYPE fize_cache_entries gauge")
+            for tier, item in sorted(gauges.items()):
+                lines.append("fize_cache_entries" + labels(tier=tier) + " " + str(item['entries']))
+            lines.append("# HELP fize_cache_bytes Current size in bytes.")
+            lines.append("# TYPE fize_cache_bytes gauge")
+            for tier, item in sorted(gauges.items()):
+                lines.append("fize_cache_bytes" + labels(tier=tier) + " " + str(item['bytes']))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def load_trace(path):
+        """
+        读取访问轨迹文件
+        :param path: 文件路径
+        :return: generator (时间戳, 操作, 键名)
+        """
+        with open(path, 'r', encoding="utf-8") as store:
+            for line in store:
+                parts = line.rstrip("\n").split("\t", 2)
+                if len(parts) == 3:
+                    yield float(parts[0]), parts[1], parts[2]
+
+    @classmethod
+    def simulate_lru(cls, trace, sizes):
+        """
+        回放访问轨迹，模拟不同容量的LRU内存缓存层的命中率
+        使用LRU栈距离一次回放即可得到所有容量的结果：栈距离小于容量的读取即为命中。
+        :param trace: 访问轨迹，文件路径或(时间戳, 操作, 键名)的可迭代对象
+        :param sizes: 待评估的条目数容量数组
+        :return: dict 容量 => 命中率，没有读取操作时为None
+        """
+        if isinstance(trace, str):
+            trace = cls.load_trace(trace)
+        reads = ("get", "has", "get_many")
+        writes = ("set", "set_many", "add", "incr")
+        removes = ("remove", "delete_many")
+        limit = max(sizes)
+        stack = OrderedDict()  # 仅保留最近的limit个键名，更远的访问对所有容量都是未命中
+        distances = [0] * limit
+        lookups = 0
+        for item in trace:
+            op, key = item[1], item[2]
+            if op in removes:
+                stack.pop(key, None)
+                continue
+            if op in reads:
+                lookups += 1
+                if key in stack:
+                    distance = 0
+                    for name in reversed(stack):
+                        if name == key:
+                            break
+                        distance += 1
+                    distances[distance] += 1
+            elif op not in writes:
+                continue
+            stack[key] = True
+            stack.move_to_end(key)
+            if len(stack) > limit:
+                stack.popitem(last=False)
+        result = {}
+        for size in sizes:
+            result[size] = sum(distances[:size]) / lookups if lookups > 0 else None
+        return result
+
+
+class _TaggedValue:
+    """
+    内存缓存层中带有标签版本号的值，读取时校验版本号
+    """
+
+    __slots__ = ("val", "stamps")
+
+    def __init__(self, val, stamps):
+        self.val = val
+        self.stamps = stamps
+
 
 class Cache:
     """
-    Cache缓存类
+    Cache缓存类
+    缓存文件按键名的SHA1摘要分两级子目录存放(如ab/cd/<摘要>.pkl)，键名原文保存在条目中，
+    单个条目的读写开销与缓存总条目数无关，键名可以包含“/”等任意字符。
+    写入时先写临时文件再原子重命名，读取方不会读到不完整的数据，多个进程可以共享同一个缓存目录。
+    每个缓存文件以固定长度的文件头开始(魔数、格式版本、序列化方式、压缩方式、标志、过期时间戳、数据长度、键名区长度)，
+    其后依次为键名区及数据，判断是否存在及是否过期时只需读取文件头。
+    序列化方式可选pickle(最高协议)、pickle5(大块缓冲区带外存放，读取时通过mmap零拷贝加载)、json、msgpack，
+    并可对超过阈值的数据使用zlib/lz4/zstd压缩。
+    可选启用进程内内存缓存层，命中时无需访问文件；内存层不感知其他进程对文件的修改。
+    内存层命中时返回的是缓存中的同一个对象而非副本，调用方不应修改返回的可变对象。
+    条目可以归属命名空间(键名前缀)及若干标签，每个命名空间及标签对应一个版本号文件，条目写入时在键名区的键名之后以独立的定长前缀字段记录所属版本号，
+    失效时只需更新版本号，读取时版本号不一致的条目视为不存在并顺带删除，其余由sweep()增量清理。
+    """
+
+    __MISSING = object()
+
+    __HEADER = struct.Struct("<4sBBBBdQI")
+
+    __MAGIC = b"FZC1"
+
+    __VERSION = 1
+
+    __PROBE = 512  # 首次读取的字节数，覆盖文件头及常见长度的键名
+
+    SERIALIZER_LEGACY = 0  # 旧版整体pickle的条目词典，仅用于读取
+
+    SERIALIZER_PICKLE = 1  # pickle协议2，早期版本写入
+
+    SERIALIZERS = {'pickle': 2, 'pickle5': 3, 'json': 4, 'msgpack': 5}
+
+    COMPRESSIONS = {'zlib': 1, 'lz4': 2, 'zstd': 3}
+
+    __BUFFER_ALIGN = 64  # 带外缓冲区的对齐字节数
+
+    __VERSION_STRIPES = 1024
+
+    __SNAPSHOT_MAGIC = b"FZCS"
+
+    __SNAPSHOT_VERSION = 1
+
+    __RECORD = struct.Struct("<Q")  # 快照中每个条目之前的长度
+
+    __FLAG_STAMPS = 1  # 文件头标志：键名区末尾带有标签版本号字段
+
+    __STAMP = struct.Struct("<Iq")  # 标签字节数、版本号
+
+    __STAMPS_LENGTH = struct.Struct("<I")  # 键名区末尾的标签版本号字段字节数
+
+    NAMESPACE_SEPARATOR = ":"
+
+    def __init__(self, path=None, memory_size=0, memory_bytes=None, memory_policy="lru", locking=True, max_bytes=None, sweep_every=0, sweep_budget=100,
+                 serializer="pickle", compress=None, compress_threshold=1024, io_workers=8, metrics=False, trace=None,
+                 generation_ttl=1.0):
+        """
+        初始化
+        :param path: 指定路径，不指定则默认为当前目录下的cache文件夹
+        :param memory_size: 进程内内存缓存层的最大条目数，0表示不启用
+        :param memory_bytes: 内存缓存层的最大估算字节数
+        :param memory_policy: 内存缓存层的淘汰策略，lru或lfu
+        :param locking: incr/add等读-改-写操作是否使用跨进程文件锁
+        :param max_bytes: 磁盘占用上限，超出时按最近访问时间淘汰，None表示不限制
+        :param sweep_every: 每多少次set()顺带清理一次过期条目，0表示不清理
+        :param sweep_budget: 每次顺带清理最多检查的文件数
+        :param serializer: 序列化方式，pickle、pickle5、json或msgpack
+        :param compress: 压缩方式，zlib、lz4、zstd或None
+        :param compress_threshold: 序列化后超过该字节数才压缩；pickle5时为带外存放缓冲区的最小字节数
+        :param io_workers: 批量操作并发执行文件读写的线程数
+        :param metrics: 是否统计运行指标，也可以传入CacheMetrics实例以自定义命名空间分隔符或在多个缓存间共享
+        :param trace: 访问轨迹，文件路径或带append方法的对象，指定时自动启用运行指标
+        :param generation_ttl: 命名空间及标签版本号在进程内的缓存时长，单位秒，其他进程的失效操作最多延迟该时长生效
+        """
+        if path is None:
+            path = os.path.abspath(os.getcwd() + os.path.sep + "cache")
+        self.__path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.__locking = locking
+        self.__max_bytes = max_bytes
+        self.__sweep_every = sweep_every
+        self.__sweep_budget = sweep_budget
+        self.__sets = 0
+        self.__sweep_iter = None
+        self.__sweep_lock = threading.Lock()
+        self.__sweeper = None
+        self.__sweeper_stop = threading.Event()
+        self.__memory = None
+        self.__fill_lock = threading.Lock()
+        self.__write_versions = [0] * self.__VERSION_STRIPES  # 按键名散列分段的写入计数，用于判断回填内存层期间是否有写入
+        if memory_size > 0:
+            self.__memory = MemoryCache(memory_size, memory_bytes, memory_policy)
+        if serializer not in self.SERIALIZERS:
+            raise ValueError("不支持的序列化方式: " + str(serializer))
+        if serializer == "pickle5" and pickle.HIGHEST_PROTOCOL < 5:
+            raise ValueError("pickle5需要Python 3.8及以上版本")
+        if serializer == "msgpack" and msgpack is None:
+            raise ValueError("msgpack序列化需要安装msgpack")
+        if compress is not None and compress not in self.COMPRESSIONS:
+            raise ValueError("不支持的压缩方式: " + str(compress))
+        if compress == "lz4" and lz4 is None:
+            raise ValueError("lz4压缩需要安装lz4")
+        if compress == "zstd" and zstandard is None:
+            raise ValueError("zstd压缩需要安装zstandard")
+        self.__serializer = self.SERIALIZERS[serializer]
+        self.__compression = self.COMPRESSIONS[compress] if compress is not None else 0
+        self.__compress_threshold = compress_threshold
+        self.__io_workers = io_workers
+        self.__pool = None
+        self.__pool_lock = threading.Lock()
+        self.__local = threading.local()  # 各线程最近一次写入的序列化开销
+        if isinstance(metrics, CacheMetrics):
+            self.__metrics = metrics
+        elif metrics or trace is not None:
+            self.__metrics = CacheMetrics(trace=trace)
+        else:
+            self.__metrics = None
+        self.__generation_ttl = generation_ttl
+        self.__generations = {}  # 标签 => (版本号, 读取时间)
+
+    @property
+    def memory(self):
+        """
+        内存缓存层，未启用时为None
+        :return: MemoryCache
+        """
+        return self.__memory
+
+    @property
+    def last_cost(self):
+        """
+        当前线程最近一次写入条目的序列化开销，set_many()等在线程池中写入的条目不会反映到调用线程
+        :return: dict 键名key、耗时seconds、序列化后字节数raw_bytes、写入文件字节数stored_bytes，当前线程未写入时为None
+        """
+        return getattr(self.__local, 'cost', None)
+
+    @property
+    def metrics(self):
+        """
+        运行指标，未启用时为None
+        :return: CacheMetrics
+        """
+        return self.__metrics
+
+    def __file(self, key):
+        """
+        获取键名对应的缓存文件路径
+        :param key: cache键名
+        :return: str
+        """
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.__path, digest[0:2], digest[2:4], digest + ".pkl")
+
+    def __write(self, full_path, parts):
+        """
+        原子写入缓存文件：先写入同目录下的临时文件再重命名，所在子目录不存在时自动创建
+        :param full_path: 文件路径
+        :param parts: 依次写入的bytes或memoryview数组
+        :return: void
+        """
+        directory = os.path.dirname(full_path)
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        except FileNotFoundError:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as store:
+                for part in parts:
+                    store.write(part)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def __timestamp(expiry_time):
+        """
+        将过期时间转换为时间戳
+        :param expiry_time: datetime过期时间
+        :return: float None表示永久有效
+        """
+        if expiry_time is None:
+            return None
+        return expiry_time.timestamp()
+
+    def __serialize(self, val):
+        """
+        序列化值
+        :param val: cache值
+        :return: tuple (数据, 带外缓冲区数组)
+        """
+        buffers = []
+        if self.__serializer == 3:
+            def callback(buffer):
+                if buffer.raw().nbytes < self.__compress_threshold:
+                    return True  # 小缓冲区直接内联
+                buffers.append(buffer.raw())
+                return False
+
+            payload = pickle.dumps(val, protocol=5, buffer_callback=callback)
+        elif self.__serializer == 4:
+            payload = json.dumps(val, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        elif self.__serializer == 5:
+            payload = msgpack.packb(val, use_bin_type=True)
+        else:
+            payload = pickle.dumps(val, protocol=pickle.HIGHEST_PROTOCOL)
+        return payload, buffers
+
+    def __encode(self, key, val, expiry, stamps=None):
+        """
+        编码缓存文件内容
+        :param key: cache键名
+        :param val: cache值
+        :param expiry: 过期时间戳，None表示永久有效
+        :param stamps: 所属标签的(标签, 版本号)数组，写入键名区的键名之后
+        :return: tuple (依次写入文件的数据块数组, 本条目的序列化开销词典)
+        """
+        start = time.perf_counter()
+        name = key.encode("utf-8")
+        flags = 0
+        if stamps:
+            name += self.__pack_stamps(stamps)
+            flags = self.__FLAG_STAMPS
+        payload, buffers = self.__serialize(val)
+        raw_bytes = len(payload) + sum([buffer.nbytes for buffer in buffers])
+        compression = 0
+        if self.__compression != 0 and len(buffers) == 0 and len(payload) >= self.__compress_threshold:
+            compression = self.__compression
+            if compression == 1:
+                payload = zlib.compress(payload)
+            elif compression == 2:
+                payload = lz4.frame.compress(payload)
+            else:
+                payload = zstandard.ZstdCompressor().compress(payload)
+        parts = []
+        if self.__serializer == 3:
+            # 带外缓冲区表：数量，及每个缓冲区在文件中的(偏移, 长度)
+            table = struct.pack("<I", len(buffers))
+            inband_length = 4 + 16 * len(buffers) + len(payload)
+            position = self.__HEADER.size + len(name) + inband_length
+            ranges = []
+            for buffer in buffers:
+                position += -position % self.__BUFFER_ALIGN
+                ranges.append((position, buffer.nbytes))
+                position += buffer.nbytes
+            for offset, length in ranges:
+                table += struct.pack("<QQ", offset, length)
+            payload = table + payload
+            parts.append(self.__HEADER.pack(self.__MAGIC, self.__VERSION, self.__serializer, compression, flags, expiry or 0.0, len(payload), len(name)))
+            parts.append(name)
+            parts.append(payload)
+            position = self.__HEADER.size + len(name) + len(payload)
+            for buffer, (offset, length) in zip(buffers, ranges):
+                parts.append(b"\0" * (offset - position))
+                parts.append(buffer)
+                position = offset + length
+        else:
+            parts.append(self.__HEADER.pack(self.__MAGIC, self.__VERSION, self.__serializer, compression, flags, expiry or 0.0, len(payload), len(name)))
+            parts.append(name)
+            parts.append(payload)
+        stored_bytes = sum([len(part) if isinstance(part, bytes) else part.nbytes for part in parts])
+        cost = {
+            'key': key,
+            'seconds': time.perf_counter() - start,
+            'raw_bytes': raw_bytes,
+            'stored_bytes': stored_bytes
+        }
+        return parts, cost
+
+    def __read_entry(self, full_path, with_payload=True):
+        """
+        读取缓存文件
+        :param full_path: 文件路径
+        :param with_payload: 是否读取数据部分，否则只读取文件头及键名
+        :return: tuple (键名, 过期时间戳, 序列化方式, 压缩方式, 数据, 文件字节数, 带外缓冲区所在的文件映射, (标签, 版本号)数组)，文件不存在时返回None
+        """
+        try:
+            store = open(full_path, 'rb')
+        except FileNotFoundError:
+            return None
+        with store:
+            head = store.read(self.__PROBE)
+            if head[:4] != self.__MAGIC:  # 旧版格式，整个文件为pickle的条目词典
+                head += store.read()
+                data = pickle.loads(head)
+                return data.get('key'), self.__timestamp(data['expiry_time']), self.SERIALIZER_LEGACY, 0, data['val'], len(head), None, ()
+            magic, version, serializer, compression, flags, expiry, length, key_length = self.__HEADER.unpack_from(head)
+            offset = self.__HEADER.size + key_length
+            if len(head) < offset:
+                head += store.read(offset - len(head))
+            key, stamps = self.__parse_name(head[self.__HEADER.size:offset], flags)
+            if not with_payload:
+                return key, expiry or None, serializer, compression, None, offset + length, None, stamps
+            payload = head[offset:]
+            if len(payload) < length:
+                payload += store.read(length - len(payload))
+            mapped = None
+            if serializer == 3 and compression == 0 and struct.unpack_from("<I", payload)[0] > 0:
+                # 与文件头使用同一个文件描述符映射，期间文件被其他进程替换也不会读到新文件的数据
+                mapped = mmap.mmap(store.fileno(), 0, access=mmap.ACCESS_READ)
+            return key, expiry or None, serializer, compression, payload, offset + length, mapped, stamps
+
+    def __decode(self, serializer, compression, payload, source=None):
+        """
+        解码数据部分
+        :param serializer: 序列化方式
+        :param compression: 压缩方式
+        :param payload: 数据
+        :param source: 缓存文件的完整内容(mmap或bytes)，pickle5带外缓冲区按文件偏移从中零拷贝加载
+        :return: mixed
+        """
+        if serializer == self.SERIALIZER_LEGACY:
+            return payload
+        if compression == 1:
+            payload = zlib.decompress(payload)
+        elif compression == 2:
+            payload = lz4.frame.decompress(payload)
+        elif compression == 3:
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        if serializer == 3:
+            count = struct.unpack_from("<I", payload)[0]
+            buffers = []
+            if count > 0:
+                mapped = memoryview(source)
+                for i in range(count):
+                    offset, length = struct.unpack_from("<QQ", payload, 4 + 16 * i)
+                    buffers.append(mapped[offset:offset + length])
+            return pickle.loads(payload[4 + 16 * count:], buffers=buffers)
+        if serializer == 4:
+            return json.loads(payload.decode("utf-8"))
+        if serializer == 5:
+            return msgpack.unpackb(payload, raw=False)
+        return pickle.loads(payload)
+
+    def __generation_file(self, tag):
+        """
+        获取标签对应的版本号文件路径
+        :param tag: 标签
+        :return: str
+        """
+        digest = hashlib.sha1(tag.encode("utf-8")).hexdigest()
+        return os.path.join(self.__path, ".generations", digest)
+
+    def __generation(self, tag, fresh=False):
+        """
+        获取标签的当前版本号，generation_ttl内使用进程内缓存
+        :param tag: 标签
+        :param fresh: 是否忽略进程内缓存
+        :return: int 未失效过的标签为0
+        """
+        now = time.monotonic()
+        cached = self.__generations.get(tag)
+        if not fresh and cached is not None and now - cached[1] < self.__generation_ttl:
+            return cached[0]
+        try:
+            with open(self.__generation_file(tag), 'rb') as store:
+                generation = int(store.read())
+        except (FileNotFoundError, ValueError):
+            generation = 0
+        self.__generations[tag] = (generation, now)
+        return generation
+
+    def __bump(self, tag):
+        """
+        更新标签版本号，使此前写入的所属条目全部失效
+        版本号取微秒时间戳且大于原值，并发更新时无论哪个写入生效，旧版本号都不会再次出现。
+        :param tag: 标签
+        :return: int 新版本号
+        """
+        generation = max(self.__generation(tag, True) + 1, int(time.time() * 1000000))
+        self.__write(self.__generation_file(tag), [str(generation).encode("ascii")])
+        self.__generations[tag] = (generation, time.monotonic())
+        return generation
+
+    def __current(self, stamps):
+        """
+        判断条目记录的标签版本号是否仍为当前版本
+        :param stamps: (标签, 版本号)数组
+        :return: bool
+        """
+        for tag, generation in stamps:
+            if self.__generation(tag) != generation:
+                return False
+        return True
+
+    def __pack_stamps(self, stamps):
+        """
+        编码标签版本号字段：依次为各标签的(字节数, 版本号)及标签，末尾为字段总字节数
+        :param stamps: (标签, 版本号)数组
+        :return: bytes
+        """
+        block = b""
+        for tag, generation in stamps:
+            tag = tag.encode("utf-8")
+            block += self.__STAMP.pack(len(tag), generation) + tag
+        return block + self.__STAMPS_LENGTH.pack(len(block))
+
+    def __parse_name(self, area, flags):
+        """
+        拆分键名区内容
+        :param area: 键名区字节串
+        :param flags: 文件头标志
+        :return: tuple (键名, (标签, 版本号)数组)
+        """
+        if not flags & self.__FLAG_STAMPS:
+            return area.decode("utf-8"), ()
+        size = self.__STAMPS_LENGTH.unpack_from(area, len(area) - self.__STAMPS_LENGTH.size)[0]
+        end = len(area) - self.__STAMPS_LENGTH.size
+        position = end - size
+        key = area[:position].decode("utf-8")
+        stamps = []
+        while position < end:
+            length, generation = self.__STAMP.unpack_from(area, position)
+            position += self.__STAMP.size
+            stamps.append((area[position:position + length].decode("utf-8"), generation))
+            position += length
+        return key, tuple(stamps)
+
+    def __entry_name(self, data):
+        """
+        从缓存文件的完整内容中读取键名及标签版本号
+        :param data: 缓存文件内容
+        :return: tuple (键名, (标签, 版本号)数组)
+        """
+        header = self.__HEADER.unpack_from(data)
+        return self.__parse_name(data[self.__HEADER.size:self.__HEADER.size + header[7]], header[4])
+
+    def __scope(self, key, namespace=None, tags=None):
+        """
+        计算带命名空间前缀的键名及条目所属的标签
+        :param key: cache键名
+        :param namespace: 命名空间
+        :param tags: 标签数组
+        :return: tuple (完整键名, 标签数组)
+        """
+        labels = []
+        if namespace is not None:
+            key = namespace + self.NAMESPACE_SEPARATOR + key
+            labels.append("@" + namespace)
+        if tags:
+            labels.extend(["#" + tag for tag in tags])
+        return key, labels
+
+    def __from_memory(self, key):
+        """
+        从内存缓存层读取，所属标签已失效的条目同时移出内存缓存层
+        :param key: cache键名
+        :return: mixed 不存在时返回__MISSING
+        """
+        val = self.__memory.get(key, self.__MISSING)
+        if isinstance(val, _TaggedValue):
+            if not self.__current(val.stamps):
+                self.__memory.remove(key)
+                return self.__MISSING
+            return val.val
+        return val
+
+    def __write_version(self, key):
+        """
+        获取键名所在分段的写入计数，读取文件前调用，回填内存层时据此判断期间是否有写入
+        :param key: cache键名
+        :return: int
+        """
+        return self.__write_versions[hash(key) % self.__VERSION_STRIPES]
+
+    def __fill(self, key, val, expiry, size, stamps, version):
+        """
+        将从文件读取的值回填内存缓存层，读取期间该键所在分段有写入时放弃回填，避免旧值覆盖新值
+        :param key: cache键名
+        :param val: 值
+        :param expiry: 过期时间戳
+        :param size: 字节数
+        :param stamps: (标签, 版本号)数组
+        :param version: 读取文件前的写入计数
+        :return: void
+        """
+        with self.__fill_lock:
+            if self.__write_versions[hash(key) % self.__VERSION_STRIPES] == version:
+                self.__memory.set(key, _TaggedValue(val, stamps) if stamps else val, expiry, size)
+
+    def __written(self, key, val=__MISSING, expiry=None, size=0, stamps=None):
+        """
+        文件写入或删除后更新写入计数及内存缓存层
+        :param key: cache键名
+        :param val: 新值，__MISSING表示已删除
+        :param expiry: 过期时间戳
+        :param size: 字节数
+        :param stamps: (标签, 版本号)数组
+        :return: void
+        """
+        with self.__fill_lock:
+            index = hash(key) % self.__VERSION_STRIPES
+            self.__write_versions[index] += 1
+            if self.__memory is None:
+                return
+            if val is self.__MISSING:
+                self.__memory.remove(key)
+            else:
+                self.__memory.set(key, _TaggedValue(val, stamps) if stamps else val, expiry, size)
+
+    def __load(self, key):
+        """
+        直接从文件读取未过期的条目，不经过内存缓存层
+        :param key: cache键名
+        :return: tuple (值, 过期时间戳, 文件字节数, (标签, 版本号)数组)，不存在、已过期或已失效时值为__MISSING
+        """
+        full_path = self.__file(key)
+        entry = self.__read_entry(full_path)
+        if entry is None:
+            return self.__MISSING, None, 0, ()
+        name, expiry, serializer, compression, payload, size, mapped, stamps = entry
+        if name is not None and name != key:  # 摘要冲突
+            return self.__MISSING, None, 0, ()
+        if expiry is not None and expiry <= time.time():
+            if self.__metrics is not None:
+                self.__metrics.expired(key)
+            return self.__MISSING, None, 0, ()
+        if stamps and not self.__current(stamps):
+            try:
+                os.remove(full_path)  # 所属命名空间或标签已失效，顺带清理
+            except OSError:
+                pass
+            return self.__MISSING, None, 0, ()
+        if self.__metrics is not None:
+            self.__metrics.transferred("read", key, size)
+        if self.__max_bytes is not None:
+            try:
+                os.utime(full_path)  # 记录访问时间用于磁盘LRU淘汰
+            except OSError:
+                pass
+        return self.__decode(serializer, compression, payload, mapped), expiry, size, stamps
+
+    def __store(self, key, val, expiry, tags=None, stamps=None):
+        """
+        写入条目
+        :param key: cache键名
+        :param val: cache值
+        :param expiry: 过期时间戳，None表示永久有效
+        :param tags: 所属标签数组，按当前版本号记录
+        :param stamps: 直接记录的(标签, 版本号)数组，优先于tags
+        :return: void
+        """
+        if stamps is None and tags:
+            stamps = tuple([(tag, self.__generation(tag)) for tag in tags])
+        parts, cost = self.__encode(key, val, expiry, stamps)
+        self.__write(self.__file(key), parts)
+        self.__local.cost = cost
+        stored_bytes = cost['stored_bytes']
+        if self.__metrics is not None:
+            self.__metrics.transferred("write", key, stored_bytes)
+        self.__written(key, val, expiry, stored_bytes, stamps)
+        if self.__sweep_every > 0:
+            self.__sets += 1
+            if self.__sets % self.__sweep_every == 0:
+                self.sweep(self.__sweep_budget)
+
+    def lock(self, key):
+        """
+        获取键名对应的跨进程文件锁，用于自定义的读-改-写操作，长时间未使用的锁文件由sweep()删除
+        :param key: cache键名
+        :return: FileLock
+        """
+        return FileLock(self.__file(key)[:-4] + ".lock")
+
+    def __guard(self, key):
+        """
+        根据locking设置返回文件锁或空上下文
+        :param key: cache键名
+        :return: 上下文管理器
+        """
+        if self.__locking:
+            return self.lock(key)
+        return _NullLock()
+
+    def set(self, key, val, duration=None, expiry_time=None, namespace=None, tags=None):
+        """
+        设置一个cache
+        :param key: cache键名
+        :param val: cache值
+        :param duration: 有效时长，单位秒。
+        :param expiry_time: 过期时间，权重大于duration
+        :param namespace: 命名空间，实际键名为“命名空间:键名”，可通过invalidate_namespace()整体失效
+        :param tags: 标签数组，可通过invalidate_tag()使带有该标签的条目全部失效
+        :return: void
+        """
+        key, labels = self.__scope(key, namespace, tags)
+        if expiry_time is not None:  # expiry_time 优先处理
+            expiry = self.__timestamp(expiry_time)
+        elif duration is not None:
+            expiry = time.time() + duration
+        else:
+            expiry = None
+        if self.__metrics is None:
+            self.__store(key, val, expiry, labels)
+            return
+        start = time.perf_counter()
+        self.__store(key, val, expiry, labels)
+        self.__metrics.record("set", key, "ok", time.perf_counter() - start)
+
+    def get(self, key, default=None, namespace=None):
+        """
+        获取一个cache
+        :param key: cache键名
+        :param default: 不存在或已过期时的返回值
+        :param namespace: 命名空间
+        :return: mixed 内存缓存层命中时返回缓存中的同一个对象，不应修改
+        """
+        if namespace is not None:
+            key = namespace + self.NAMESPACE_SEPARATOR + key
+        if self.__metrics is None:
+            return self.__get(key, default)
+        start = time.perf_counter()
+        val = self.__get(key, self.__MISSING)
+        hit = val is not self.__MISSING
+        self.__metrics.record("get", key, "hit" if hit else "miss", time.perf_counter() - start)
+        return val if hit else default
+
+    def __get(self, key, default):
+        """
+        依次从内存缓存层及文件读取，文件命中时回填内存缓存层
+        :param key: cache键名
+        :param default: 不存在或已过期时的返回值
+        :return: mixed
+        """
+        if self.__memory is None:
+            val = self.__load(key)[0]
+            return default if val is self.__MISSING else val
+        val = self.__from_memory(key)
+        if val is not self.__MISSING:
+            return val
+        version = self.__write_version(key)
+        val, expiry, size, stamps = self.__load(key)
+        if val is self.__MISSING:
+            return default
+        self.__fill(key, val, expiry, size, stamps, version)
+        return val
+
+    def has(self, key, namespace=None):
+        """
+        判断是否存在未过期的cache，只读取文件头
+        :param key: cache键名
+        :param namespace: 命名空间
+        :return: bool
+        """
+        if namespace is not None:
+            key = namespace + self.NAMESPACE_SEPARATOR + key
+        if self.__metrics is None:
+            return self.__has(key)
+        start = time.perf_counter()
+        exists = self.__has(key)
+        self.__metrics.record("has", key, "hit" if exists else "miss", time.perf_counter() - start)
+        return exists
+
+    def __has(self, key):
+        """
+        判断是否存在未过期的cache
+        :param key: cache键名
+        :return: bool
+        """
+        if self.__memory is not None and self.__from_memory(key) is not self.__MISSING:
+            return True
+        entry = self.__read_entry(self.__file(key), False)
+        if entry is None:
+            return False
+        name, expiry, stamps = entry[0], entry[1], entry[7]
+        if name is not None and name != key:
+            return False
+        if expiry is not None and expiry <= time.time():
+            return False
+        return not stamps or self.__current(stamps)
+
+    def add(self, key, val, duration=None, expiry_time=None, namespace=None, tags=None):
+        """
+        仅当cache不存在(或已过期)时设置
+        :param key: cache键名
+        :param val: cache值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :param namespace: 命名空间
+        :param tags: 标签数组
+        :return: bool 是否设置成功
+        """
+        full_key = key if namespace is None else namespace + self.NAMESPACE_SEPARATOR + key
+        with self.__guard(full_key):
+            if self.__has(full_key):
+                return False
+            self.set(key, val, duration, expiry_time, namespace, tags)
+            return True
+
+    def incr(self, key, delta=1, duration=None, namespace=None, tags=None):
+        """
+        对数值cache做原子增减，不存在时从0开始，已存在时保留原过期时间及所属标签
+        :param key: cache键名
+        :param delta: 增量
+        :param duration: 新建时的有效时长，单位秒
+        :param namespace: 命名空间
+        :param tags: 新建时的标签数组
+        :return: 增减后的值
+        """
+        key, labels = self.__scope(key, namespace, tags)
+        with self.__guard(key):
+            val, expiry, size, stamps = self.__load(key)
+            if val is self.__MISSING:
+                val = delta
+                expiry = time.time() + duration if duration is not None else None
+                self.__store(key, val, expiry, labels)
+            else:
+                val = val + delta
+                self.__store(key, val, expiry, stamps=stamps)
+            return val
+
+    def remove(self, key, namespace=None):
+        """
+        删除指定cache
+        :param key: cache键名
+        :param namespace: 命名空间
+        :return: 
+        """
+        if namespace is not None:
+            key = namespace + self.NAMESPACE_SEPARATOR + key
+        if self.__metrics is None:
+            self.__remove(key)
+            return
+        start = time.perf_counter()
+        self.__remove(key)
+        self.__metrics.record("remove", key, "ok", time.perf_counter() - start)
+
+    def __remove(self, key):
+        """
+        从内存缓存层及文件中删除
+        :param key: cache键名
+        :return: void
+        """
+        try:
+            os.remove(self.__file(key))
+        except FileNotFoundError:
+            pass
+        self.__written(key)
+
+    def __map(self, func, items):
+        """
+        在线程池中并发执行文件读写，单项或未启用线程池时直接顺序执行
+        :param func: 处理函数
+        :param items: 参数数组
+        :return: list 结果数组
+        """
+        if len(items) <= 1 or self.__io_workers <= 1:
+            return [func(item) for item in items]
+        if self.__pool is None:
+            with self.__pool_lock:
+                if self.__pool is None:
+                    self.__pool = ThreadPoolExecutor(self.__io_workers, thread_name_prefix="fize-cache")
+        return list(self.__pool.map(func, items))
+
+    def get_many(self, keys, namespace=None):
+        """
+        批量获取cache，内存缓存层未命中的键并发读取文件
+        :param keys: cache键名数组
+        :param namespace: 命名空间
+        :return: dict 键名 => 值，不存在或已过期的键不包含在内，键名不含命名空间前缀
+        """
+        start = time.perf_counter() if self.__metrics is not None else None
+        prefix = "" if namespace is None else namespace + self.NAMESPACE_SEPARATOR
+        result = {}
+        pending = []
+        versions = []
+        seen = set()
+        for key in keys:
+            key = prefix + key
+            if key in seen:
+                continue
+            seen.add(key)
+            if self.__memory is not None:
+                val = self.__from_memory(key)
+                if val is not self.__MISSING:
+                    result[key] = val
+                    continue
+                versions.append(self.__write_version(key))
+            pending.append(key)
+        for i, (val, expiry, size, stamps) in enumerate(self.__map(self.__load, pending)):
+            if val is self.__MISSING:
+                continue
+            result[pending[i]] = val
+            if self.__memory is not None:
+                self.__fill(pending[i], val, expiry, size, stamps, versions[i])
+        if start is not None and len(seen) > 0:
+            for key in seen:
+                self.__metrics.count("get_many", key, "hit" if key in result else "miss")
+            self.__metrics.record("get_many", next(iter(seen)), "ok", time.perf_counter() - start, 0)
+        if prefix:
+            return {key[len(prefix):]: val for key, val in result.items()}
+        return result
+
+    def set_many(self, mapping, duration=None, expiry_time=None, namespace=None, tags=None):
+        """
+        批量设置cache，并发写入文件
+        :param mapping: dict 键名 => 值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :param namespace: 命名空间
+        :param tags: 全部条目共同的标签数组
+        :return: void
+        """
+        if expiry_time is not None:
+            expiry = self.__timestamp(expiry_time)
+        elif duration is not None:
+            expiry = time.time() + duration
+        else:
+            expiry = None
+        labels = self.__scope("", namespace, tags)[1]
+        stamps = tuple([(tag, self.__generation(tag)) for tag in labels])
+        prefix = "" if namespace is None else namespace + self.NAMESPACE_SEPARATOR
+        items = [(prefix + key, val) for key, val in mapping.items()]
+        if self.__metrics is None or len(items) == 0:
+            self.__map(lambda item: self.__store(item[0], item[1], expiry, stamps=stamps), items)
+            return
+        start = time.perf_counter()
+        self.__map(lambda item: self.__store(item[0], item[1], expiry, stamps=stamps), items)
+        for key, val in items:
+            self.__metrics.count("set_many", key, "ok")
+        self.__metrics.record("set_many", items[0][0], "ok", time.perf_counter() - start, 0)
+
+    def delete_many(self, keys, namespace=None):
+        """
+        批量删除cache，并发删除文件
+        :param keys: cache键名数组
+        :param namespace: 命名空间
+        :return: void
+        """
+        prefix = "" if namespace is None else namespace + self.NAMESPACE_SEPARATOR
+        keys = [prefix + key for key in keys]
+        if self.__metrics is None or len(keys) == 0:
+            self.__map(self.__remove, keys)
+            return
+        start = time.perf_counter()
+        self.__map(self.__remove, keys)
+        for key in keys:
+            self.__metrics.count("delete_many", key, "ok")
+        self.__metrics.record("delete_many", keys[0], "ok", time.perf_counter() - start, 0)
+
+    def __walk(self):
+        """
+        遍历两级子目录下的全部文件
+        :return: generator os.DirEntry
+        """
+        try:
+            level1 = list(os.scandir(self.__path))
+        except FileNotFoundError:
+            return
+        for first in level1:
+            if not first.is_dir():
+                continue
+            for second in os.scandir(first.path):
+                if not second.is_dir():
+                    continue
+                for item in os.scandir(second.path):
+                    yield item
+
+    def sweep(self, budget=1000):
+        """
+        增量清理过期条目、所属命名空间或标签已失效的条目、残留的临时文件及一小时前创建且未被持有的锁文件，每次最多检查budget个文件，多次调用依次覆盖整个目录
+        :param budget: 本次最多检查的文件数
+        :return: int 删除的文件数
+        """
+        if not self.__sweep_lock.acquire(False):  # 其他线程正在清理
+            return 0
+        removed = 0
+        try:
+            now = time.time()
+            for i in range(budget):
+                if self.__sweep_iter is None:
+                    self.__sweep_iter = self.__walk()
+                try:
+                    item = next(self.__sweep_iter)
+                except StopIteration:
+                    self.__sweep_iter = None
+                    break
+                try:
+                    if item.name.startswith(".tmp-"):
+                        if item.stat().st_mtime < now - 3600:
+                            os.remove(item.path)
+                            removed += 1
+                    elif item.name.endswith(".lock"):
+                        if item.stat().st_mtime < now - 3600 and FileLock.discard(item.path):
+                            removed += 1
+                    elif item.name.endswith(".pkl"):
+                        entry = self.__read_entry(item.path, False)
+                        if entry is None:
+                            continue
+                        stamps = entry[7]
+                        if (entry[1] is not None and entry[1] <= now) or (stamps and not self.__current(stamps)):
+                            os.remove(item.path)
+                            removed += 1
+                except (OSError, ValueError, pickle.UnpicklingError, struct.error):
+                    pass
+        finally:
+            self.__sweep_lock.release()
+        return removed
+
+    def evict(self, max_bytes=None):
+        """
+        磁盘占用超出上限时按最近访问时间淘汰条目
+        :param max_bytes: 磁盘占用上限，默认使用初始化时的max_bytes
+        :return: int 淘汰的条目数
+        """
+        if max_bytes is None:
+            max_bytes = self.__max_bytes
+        if max_bytes is None:
+            return 0
+        entries = []
+        total = 0
+        for item in self.__walk():
+            if not item.name.endswith(".pkl"):
+                continue
+            try:
+                stat = item.stat()
+            except OSError:
+                continue
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, item.path))
+            total += stat.st_size
+        removed = 0
+        if total <= max_bytes:
+            return 0
+        entries.sort()
+        for accessed, size, full_path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(full_path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def invalidate_namespace(self, namespace):
+        """
+        使命名空间下通过namespace参数写入的条目全部失效，只更新版本号，耗时与条目数无关
+        :param namespace: 命名空间
+        :return: void
+        """
+        self.__bump("@" + namespace)
+
+    def invalidate_tag(self, tag):
+        """
+        使带有指定标签的条目全部失效，只更新版本号，耗时与条目数无关
+        :param tag: 标签
+        :return: void
+        """
+        self.__bump("#" + tag)
+
+    def stats(self, scan=False):
+        """
+        获取运行指标快照及内存缓存层、磁盘的存量
+        :param scan: 是否遍历缓存目录统计磁盘条目数及占用字节数，条目较多时开销较大
+        :return: dict 未启用运行指标时operations等计数项为空
+        """
+        if self.__metrics is not None:
+            result = self.__metrics.snapshot()
+        else:
+            result = {'operations': {}, 'latency': {}, 'expired': {}, 'bytes': {}}
+        result['gauges'] = self.__gauges(scan)
+        return result
+
+    def prometheus(self, scan=False):
+        """
+        导出运行指标为Prometheus文本格式
+        :param scan: 是否遍历缓存目录统计磁盘条目数及占用字节数
+        :return: str
+        """
+        metrics = self.__metrics if self.__metrics is not None else CacheMetrics()
+        return metrics.prometheus(self.__gauges(scan))
+
+    def __gauges(self, scan):
+        """
+        统计内存缓存层及磁盘的存量
+        :param scan: 是否遍历缓存目录
+        :return: dict 层级 => {'entries': 条目数, 'bytes': 字节数}
+        """
+        gauges = {}
+        if self.__memory is not None:
+            gauges['memory'] = {'entries': len(self.__memory), 'bytes': self.__memory.bytes}
+        if scan:
+            entries = 0
+            total = 0
+            for item in self.__walk():
+                if not item.name.endswith(".pkl"):
+                    continue
+                try:
+                    total += item.stat().st_size
+                except OSError:
+                    continue
+                entries += 1
+            gauges['disk'] = {'entries': entries, 'bytes': total}
+        return gauges
+
+    def start_sweeper(self, interval=60, budget=1000):
+        """
+        启动后台清理线程，定期清理过期条目，设置了max_bytes时同时执行容量淘汰
+        :param interval: 清理间隔，单位秒
+        :param budget: 每次最多检查的文件数
+        :return: void
+        """
+        if self.__sweeper is not None and self.__sweeper.is_alive():
+            return
+        self.__sweeper_stop.clear()
+
+        def run():
+            while not self.__sweeper_stop.wait(interval):
+                try:
+                    self.sweep(budget)
+                    if self.__max_bytes is not None:
+                        self.evict()
+                except Exception:
+                    pass
+
+        self.__sweeper = threading.Thread(target=run, name="fize-cache-sweeper", daemon=True)
+        self.__sweeper.start()
+
+    def stop_sweeper(self):
+        """
+        停止后台清理线程
+        :return: void
+        """
+        self.__sweeper_stop.set()
+        if self.__sweeper is not None:
+            self.__sweeper.join()
+            self.__sweeper = None
+
+    def migrate(self):
+        """
+        将旧版平铺布局(<path>/<key>.pkl)的缓存文件迁移到分级目录布局，已过期的条目直接删除
+        :return: int 迁移的条目数
+        """
+        count = 0
+        for name in os.listdir(self.__path):
+            full_path = os.path.join(self.__path, name)
+            if not name.endswith(".pkl") or not os.path.isfile(full_path):
+                continue
+            with open(full_path, 'rb') as store:
+                data = pickle.load(store)
+            if data["expiry_time"] is None or data["expiry_time"] > datetime.datetime.now():
+                self.set(name[:-4], data["val"], expiry_time=data["expiry_time"])
+                count += 1
+            os.remove(full_path)
+        return count
+
+    def snapshot(self, path, max_entries=None):
+        """
+        将未过期的热点条目写入单个快照文件，供新进程通过warm()预热
+        快照依次保存各条目的缓存文件原始内容，无需重新序列化；条目按访问时间从旧到新排列，
+        内存缓存层中的条目视为最热，排在最后，预热时后加载的条目在LRU内存缓存层中最晚被淘汰。
+        :param path: 快照文件路径，先写入临时文件再原子重命名
+        :param max_entries: 最多保存的条目数，超出时保留最近访问的条目，None表示不限制
+        :return: int 保存的条目数
+        """
+        hot = []
+        if self.__memory is not None:
+            hot = [self.__file(key) for key in self.__memory.keys()]
+        excluded = set(hot)
+        files = []
+        for item in self.__walk():
+            if not item.name.endswith(".pkl") or item.path in excluded:
+                continue
+            try:
+                stat = item.stat()
+            except OSError:
+                continue
+            files.append((max(stat.st_atime, stat.st_mtime), item.path))
+        files.sort()
+        paths = [full_path for accessed, full_path in files] + hot
+        if max_entries is not None:
+            paths = paths[-max_entries:] if max_entries > 0 else []
+        now = time.time()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        count = 0
+        try:
+            with os.fdopen(fd, 'wb') as store:
+                store.write(self.__SNAPSHOT_MAGIC + struct.pack("<B3x", self.__SNAPSHOT_VERSION))
+                for full_path in paths:
+                    try:
+                        with open(full_path, 'rb') as entry:
+                            data = entry.read()
+                    except FileNotFoundError:
+                        continue
+                    if data[:4] != self.__MAGIC:  # 旧版格式的条目不写入快照
+                        continue
+                    expiry = self.__HEADER.unpack_from(data)[5]
+                    if expiry and expiry <= now:
+                        continue
+                    stamps = self.__entry_name(data)[1]
+                    if stamps and not self.__current(stamps):
+                        continue
+                    store.write(self.__RECORD.pack(len(data)))
+                    store.write(data)
+                    count += 1
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return count
+
+    def warm(self, path, overwrite=False, batch_size=1000):
+        """
+        从快照文件流式预热，跳过快照后已过期或已失效的条目
+        条目原样写回缓存文件，按batch_size分批并发写入；启用内存缓存层时同时按快照顺序填充内存缓存层。
+        :param path: 快照文件路径
+        :param overwrite: 是否覆盖已存在的缓存文件，默认保留(其内容不会比快照更旧)
+        :param batch_size: 每批并发写入的条目数
+        :return: int 写入的条目数
+        """
+        loaded = 0
+        batch = []
+        directories = set()
+        now = time.time()
+        with open(path, 'rb') as store:
+            head = store.read(8)
+            if head[:4] != self.__SNAPSHOT_MAGIC:
+                raise ValueError("无效的缓存快照文件: " + str(path))
+            while True:
+                prefix = store.read(self.__RECORD.size)
+                if len(prefix) < self.__RECORD.size:
+                    break
+                length = self.__RECORD.unpack(prefix)[0]
+                data = store.read(length)
+                if len(data) < length:  # 快照文件被截断
+                    break
+                expiry = self.__HEADER.unpack_from(data)[5]
+                if expiry and expiry <= now:
+                    continue
+                key, stamps = self.__entry_name(data)
+                if stamps and not self.__current(stamps):
+                    continue
+                batch.append((key, data))
+                if len(batch) >= batch_size:
+                    loaded += self.__warm_batch(batch, overwrite, directories)
+                    batch = []
+        if len(batch) > 0:
+            loaded += self.__warm_batch(batch, overwrite, directories)
+        return loaded
+
+    def __warm_batch(self, batch, overwrite, directories):
+        """
+        写入一批快照条目
+        :param batch: (键名, 缓存文件内容)数组
+        :param overwrite: 是否覆盖已存在的缓存文件
+        :param directories: 已确认存在的子目录集合，预先创建子目录以免逐个文件写入失败后重试
+        :return: int 写入的条目数
+        """
+        items = []
+        for key, data in batch:
+            full_path = self.__file(key)
+            directory = os.path.dirname(full_path)
+            if directory not in directories:
+                os.makedirs(directory, exist_ok=True)
+                directories.add(directory)
+            items.append((full_path, data))
+
+        def restore(item):
+            if not overwrite and os.path.exists(item[0]):
+                return False
+            self.__write(item[0], [item[1]])
+            return True
+
+        versions = [self.__write_version(key) for key, data in batch]
+        written = self.__map(restore, items)
+        if self.__memory is not None:
+            for (key, data), done, version in zip(batch, written, versions):
+                if not done:
+                    continue
+                _magic, _fmt, serializer, compression, flags, expiry, length, key_length = self.__HEADER.unpack_from(data)
+                offset = self.__HEADER.size + key_length
+                stamps = self.__parse_name(data[self.__HEADER.size:offset], flags)[1]
+                try:
+                    val = self.__decode(serializer, compression, data[offset:offset + length], data)
+                except Exception:
+                    continue
+                self.__fill(key, val, expiry or None, len(data), stamps, version)
+        return sum([1 for done in written if done])
+
+    def clear(self):
+        """
+        清空所有cache
+        :return: 
+        """
+        import shutil
+        if self.__memory is not None:
+            self.__memory.clear()
+        shutil.rmtree(self.__path)
+
+
+class SqliteCache:
+    """
+    基于SQLite单文件的Cache后端
+    与Cache提供相同的set/get/has/remove/clear接口，全部条目保存在一个WAL模式的SQLite文件中，
+    适用于大量小条目的场景，避免每个键一个文件带来的inode消耗及打开/关闭开销。
+    过期时间字段带索引，可以直接批量清理；写入可先缓冲在内存中，按条数或时间间隔在一个短事务中合并提交，
+    事务只在提交期间持有写锁，其他连接不会因为缓冲中的写入而被阻塞。
+    """
+
+    __DELETED = object()  # 缓冲中表示删除的标记
+
+    def __init__(self, path=None, commit_every=1, commit_interval=None, timeout=30):
+        """
+        初始化
+        :param path: SQLite文件路径，不指定则默认为当前目录下的cache.sqlite3
+        :param commit_every: 缓冲多少次写入后提交一次，1表示每次写入立即提交
+        :param commit_interval: 缓冲中写入的最长保留时间，单位秒，到时由后台定时器提交，None表示不限制
+        :param timeout: 等待其他连接释放写锁的最长时间，单位秒
+        """
+        if path is None:
+            path = os.path.abspath(os.getcwd() + os.path.sep + "cache.sqlite3")
+        directory = os.path.dirname(path)
+        if directory != "" and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.__path = path
+        self.__commit_every = commit_every
+        self.__commit_interval = commit_interval
+        self.__timeout = timeout
+        self.__local = threading.local()
+        self.__pending = {}  # 键名 => (过期时间戳, 序列化后的值)或__DELETED，尚未提交的写入
+        self.__pending_lock = threading.RLock()
+        self.__timer = None
+        conn = self.__connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expiry REAL, value BLOB)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expiry ON cache (expiry)")
+
+    def __connection(self):
+        """
+        获取当前线程的连接，SQLite连接不能跨线程共享
+        :return: sqlite3.Connection
+        """
+        conn = getattr(self.__local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.__path, timeout=self.__timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.__local.conn = conn
+        return conn
+
+    def __buffer(self, rows):
+        """
+        将写入放入缓冲，按设置决定立即提交或启动定时提交
+        :param rows: (键名, (过期时间戳, 序列化后的值)或__DELETED)数组
+        :return: void
+        """
+        with self.__pending_lock:
+            for key, row in rows:
+                self.__pending[key] = row
+            if len(self.__pending) >= self.__commit_every:
+                self.commit()
+            elif self.__commit_interval is not None and self.__timer is None:
+                self.__timer = threading.Timer(self.__commit_interval, self.__flush_timer)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def __flush_timer(self):
+        """
+        定时提交缓冲中的写入
+        :return: void
+        """
+        try:
+            self.commit()
+        except sqlite3.Error:
+            pass
+        finally:
+            self.__close_connection()  # 定时器线程使用后即结束，关闭其连接
+
+    def __pending_row(self, key):
+        """
+        获取缓冲中的写入
+        :param key: cache键名
+        :return: (过期时间戳, 序列化后的值)、__DELETED或None(不在缓冲中)
+        """
+        with self.__pending_lock:
+            return self.__pending.get(key)
+
+    def commit(self):
+        """
+        在一个短事务中提交缓冲中的全部写入
+        :return: void
+        """
+        with self.__pending_lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            if len(self.__pending) == 0:
+                return
+            pending = self.__pending
+            self.__pending = {}
+            writes = []
+            deletes = []
+            for key, row in pending.items():
+                if row is self.__DELETED:
+                    deletes.append((key,))
+                else:
+                    writes.append((key, row[0], row[1]))
+            conn = self.__connection()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if deletes:
+                    conn.executemany("DELETE FROM cache WHERE key=?", deletes)
+                if writes:
+                    conn.executemany("INSERT OR REPLACE INTO cache (key, expiry, value) VALUES (?, ?, ?)", writes)
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                pending.update(self.__pending)  # 提交失败时放回缓冲，保留之后的写入
+                self.__pending = pending
+                raise
+
+    @staticmethod
+    def __expiry(duration, expiry_time):
+        """
+        计算过期时间戳
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: float None表示永久有效
+        """
+        if expiry_time is not None:
+            return expiry_time.timestamp()
+        if duration is not None:
+            return time.time() + duration
+        return None
+
+    def set(self, key, val, duration=None, expiry_time=None):
+        """
+        设置一个cache
+        :param key: cache键名
+        :param val: cache值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: void
+        """
+        self.__buffer([(key, (self.__expiry(duration, expiry_time), pickle.dumps(val, pickle.HIGHEST_PROTOCOL)))])
+
+    def __row(self, key):
+        """
+        获取未过期的条目，缓冲中的写入优先
+        :param key: cache键名
+        :return: tuple (过期时间戳, 序列化后的值)，不存在或已过期时返回None
+        """
+        row = self.__pending_row(key)
+        if row is None:
+            row = self.__connection().execute("SELECT expiry, value FROM cache WHERE key=?", (key,)).fetchone()
+        if row is None or row is self.__DELETED or (row[0] is not None and row[0] <= time.time()):
+            return None
+        return row
+
+    def get(self, key, default=None):
+        """
+        获取一个cache
+        :param key: cache键名
+        :param default: 不存在或已过期时的返回值
+        :return: mixed
+        """
+        row = self.__row(key)
+        if row is None:
+            return default
+        return pickle.loads(row[1])
+
+    def has(self, key):
+        """
+        判断是否存在未过期的cache
+        :param key: cache键名
+        :return: bool
+        """
+        return self.__row(key) is not None
+
+    def add(self, key, val, duration=None, expiry_time=None):
+        """
+        仅当cache不存在(或已过期)时设置，先提交缓冲再在一个短事务中检查并写入
+        :param key: cache键名
+        :param val: cache值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: bool 是否设置成功
+        """
+        expiry = self.__expiry(duration, expiry_time)
+        with self.__pending_lock:
+            self.commit()
+            conn = self.__connection()
+            conn.execute("BEGIN IMMEDIATE")  # 持有写锁，检查与写入之间不会被其他连接插入
+            try:
+                row = conn.execute("SELECT expiry FROM cache WHERE key=?", (key,)).fetchone()
+                if row is not None and (row[0] is None or row[0] > time.time()):
+                    conn.execute("COMMIT")
+                    return False
+                conn.execute("INSERT OR REPLACE INTO cache (key, expiry, value) VALUES (?, ?, ?)", (key, expiry, pickle.dumps(val, pickle.HIGHEST_PROTOCOL)))
+                conn.execute("COMMIT")
+                return True
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+    def incr(self, key, delta=1, duration=None):
+        """
+        对数值cache做原子增减，不存在时从0开始，已存在时保留原过期时间
+        先提交缓冲再在一个短事务中读取并写入
+        :param key: cache键名
+        :param delta: 增量
+        :param duration: 新建时的有效时长，单位秒
+        :return: 增减后的值
+        """
+        with self.__pending_lock:
+            self.commit()
+            conn = self.__connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT value, expiry FROM cache WHERE key=?", (key,)).fetchone()
+                if row is None or (row[1] is not None and row[1] <= time.time()):
+                    val = delta
+                    expiry = time.time() + duration if duration is not None else None
+                else:
+                    val = pickle.loads(row[0]) + delta
+                    expiry = row[1]
+                conn.execute("INSERT OR REPLACE INTO cache (key, expiry, value) VALUES (?, ?, ?)", (key, expiry, pickle.dumps(val, pickle.HIGHEST_PROTOCOL)))
+                conn.execute("COMMIT")
+                return val
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+    def remove(self, key):
+        """
+        删除指定cache
+        :param key: cache键名
+        :return: void
+        """
+        self.__buffer([(key, self.__DELETED)])
+
+    def get_many(self, keys):
+        """
+        批量获取cache，每500个键使用一次IN查询，缓冲中的写入优先
+        :param keys: cache键名数组
+        :return: dict 键名 => 值，不存在或已过期的键不包含在内
+        """
+        now = time.time()
+        result = {}
+        queried = []
+        with self.__pending_lock:
+            for key in keys:
+                row = self.__pending.get(key)
+                if row is None:
+                    queried.append(key)
+                elif row is not self.__DELETED and (row[0] is None or row[0] > now):
+                    result[key] = pickle.loads(row[1])
+        conn = self.__connection()
+        for i in range(0, len(queried), 500):
+            part = queried[i:i + 500]
+            sql = "SELECT key, value, expiry FROM cache WHERE key IN (" + ",".join(["?" for key in part]) + ")"
+            for key, value, expiry in conn.execute(sql, part):
+                if expiry is None or expiry > now:
+                    result[key] = pickle.loads(value)
+        return result
+
+    def set_many(self, mapping, duration=None, expiry_time=None):
+        """
+        批量设置cache，在同一次提交中写入
+        :param mapping: dict 键名 => 值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: void
+        """
+        expiry = self.__expiry(duration, expiry_time)
+        self.__buffer([(key, (expiry, pickle.dumps(val, pickle.HIGHEST_PROTOCOL))) for key, val in mapping.items()])
+
+    def delete_many(self, keys):
+        """
+        批量删除cache，在同一次提交中删除
+        :param keys: cache键名数组
+        :return: void
+        """
+        self.__buffer([(key, self.__DELETED) for key in keys])
+
+    def sweep(self):
+        """
+        使用过期时间索引删除全部过期条目
+        :return: int 删除的条目数
+        """
+        self.commit()
+        conn = self.__connection()
+        return conn.execute("DELETE FROM cache WHERE expiry IS NOT NULL AND expiry<=?", (time.time(),)).rowcount
+
+    def clear(self):
+        """
+        清空所有cache
+        :return: void
+        """
+        with self.__pending_lock:
+            self.commit()
+            self.__connection().execute("DELETE FROM cache")
+
+    def __close_connection(self):
+        """
+        关闭当前线程的连接
+        :return: void
+        """
+        conn = getattr(self.__local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.__local.conn = None
+
+    def close(self):
+        """
+        提交缓冲中的写入并关闭当前线程的连接
+        :return: void
+        """
+        self.commit()
+        self.__close_connection()
+
+
+class SharedMemoryCache:
+    """
+    基于multiprocessing.shared_memory的Cache后端，供同一主机上的多个工作进程共享热点数据
+    共享内存段由固定大小的组相联哈希表及等长槽位区组成：键名的摘要决定所在的组，每组ways个槽位，
+    每个槽位保存键名、值及元数据，值超过槽位容量时不写入。
+    bytes、bytearray、memoryview等值按原始字节存放，读取时只需一次内存拷贝，其余值使用pickle序列化。
+    读取不加锁，通过每个槽位的序列号(seqlock)校验读取期间未被改写；写入通过跨进程文件锁串行执行。
+    组内无空闲槽位时依次淘汰已过期条目、最久未访问的条目。
+    共享内存段在所有进程退出后仍然保留，需要时调用unlink()删除。
     """
 
-    def __init__(self, path=None):
+    __MAGIC = b"FZSM"
+
+    __VERSION = 1
+
+    __HEADER = struct.Struct("<4sBxxxIII")  # 魔数、格式版本、组数、每组槽位数、槽位字节数
+
+    __HEADER_SIZE = 64
+
+    __META = struct.Struct("<IIQdIBxxxd")  # 序列号、键名长度(0表示空槽位)、键名摘要、过期时间戳、值长度、值类型、最近访问时间
+
+    __FIELDS = 7
+
+    __BODY = struct.Struct("<IQdIBxxxd")  # 序列号之后的元数据
+
+    __SEQ = struct.Struct("<I")
+
+    __ATIME = struct.Struct("<d")
+
+    __ATIME_OFFSET = 32
+
+    __RETRIES = 100  # 读取时遇到正在写入的槽位的最大重试次数
+
+    def __init__(self, name="fize-cache", slots=4096, slot_size=4096, ways=8, lock_path=None):
         """
-        初始化
-        :param path: 指定路径，不指定则默认为当前目录下的cache文件夹
+        初始化，共享内存段不存在时创建，已存在时直接连接并沿用其容量设置
+        :param name: 共享内存段名称，使用同一名称的进程共享数据
+        :param slots: 槽位总数，即最大条目数
+        :param slot_size: 每个槽位的字节数，键名及值的长度之和不能超过该值
+        :param ways: 每组槽位数，组内按过期时间及最近访问时间淘汰
+        :param lock_path: 写入时使用的文件锁路径，不指定则使用系统临时目录
         """
-        if path is None:
-            path = os.path.abspath(os.getcwd() + os.path.sep + "cache")
-        self.__path = path
-        if not os.path.isdir(path):
-            os.makedirs(path)
+        if shared_memory is None:
+            raise RuntimeError("共享内存缓存需要Python 3.8及以上版本")
+        if lock_path is None:
+            lock_path = os.path.join(tempfile.gettempdir(), "fize-shm-" + name + ".lock")
+        self.__name = name
+        self.__lock_path = lock_path
+        self.__thread_lock = threading.Lock()
+        with self.__writer():
+            try:
+                self.__shm = self.__open(name, False, 0)
+            except FileNotFoundError:
+                buckets = max(1, -(-slots // ways))
+                self.__shm = self.__open(name, True, self.__layout(buckets, ways, slot_size)[2])
+                self.__HEADER.pack_into(self.__shm.buf, 0, self.__MAGIC, self.__VERSION, buckets, ways, slot_size)
+        magic, version, buckets, ways, slot_size = self.__HEADER.unpack_from(self.__shm.buf, 0)
+        if magic != self.__MAGIC or version != self.__VERSION:
+            self.__shm.close()
+            raise ValueError("共享内存段" + name + "不是有效的缓存")
+        self.__buf = self.__shm.buf
+        self.__buckets = buckets
+        self.__ways = ways
+        self.__slot_size = slot_size
+        self.__data = self.__layout(buckets, ways, slot_size)[1]
+        self.__bucket = struct.Struct("<" + "IIQdIBxxxd" * ways)
+
+    @classmethod
+    def __layout(cls, buckets, ways, slot_size):
+        """
+        计算共享内存段的布局
+        :param buckets: 组数
+        :param ways: 每组槽位数
+        :param slot_size: 槽位字节数
+        :return: tuple (元数据区偏移, 槽位区偏移, 总字节数)
+        """
+        total = buckets * ways
+        data = cls.__HEADER_SIZE + total * cls.__META.size
+        data += -data % 64
+        return cls.__HEADER_SIZE, data, data + total * slot_size
+
+    @staticmethod
+    def __tracked():
+        """
+        SharedMemory是否支持track参数
+        :return: bool
+        """
+        import inspect
+        return "track" in inspect.signature(shared_memory.SharedMemory).parameters
+
+    @classmethod
+    def __open(cls, name, create, size):
+        """
+        创建或连接共享内存段，并取消resource_tracker的跟踪，避免任一进程退出时删除其他进程仍在使用的共享内存段
+        :param name: 名称
+        :param create: 是否创建
+        :param size: 创建时的字节数
+        :return: SharedMemory
+        """
+        if cls.__tracked():
+            return shared_memory.SharedMemory(name, create, size, track=False)
+        shm = shared_memory.SharedMemory(name, create, size)  # Python 3.13以下不支持track参数
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+    def __writer(self):
+        """
+        获取写入锁，同一进程内的线程及不同进程之间均互斥
+        :return: 上下文管理器
+        """
+        return _WriterLock(self.__thread_lock, self.__lock_path)
+
+    @staticmethod
+    def __hash(name):
+        """
+        计算键名摘要，各进程结果一致
+        :param name: 键名字节串
+        :return: int
+        """
+        return int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), "little")
+
+    def __meta(self, index):
+        """
+        获取槽位元数据的偏移
+        :param index: 槽位序号
+        :return: int
+        """
+        return self.__HEADER_SIZE + index * self.__META.size
+
+    def __read(self, name, digest):
+        """
+        无锁读取条目，读取期间槽位被改写时重试
+        :param name: 键名字节串
+        :param digest: 键名摘要
+        :return: tuple (值类型, 值字节串, 过期时间戳, 槽位序号)，不存在时返回None
+        """
+        buf = self.__buf
+        first = (digest % self.__buckets) * self.__ways
+        for attempt in range(self.__RETRIES):
+            fields = self.__bucket.unpack_from(buf, self.__meta(first))
+            busy = False
+            for way in range(self.__ways):
+                seq, key_length, key_digest, expiry, length, flags = fields[way * self.__FIELDS:way * self.__FIELDS + 6]
+                if key_digest != digest or key_length != len(name):
+                    continue
+                if seq & 1:
+                    busy = True
+                    break
+                index = first + way
+                offset = self.__data + index * self.__slot_size
+                raw = bytes(buf[offset:offset + key_length + length])
+                if self.__SEQ.unpack_from(buf, self.__meta(index))[0] != seq:
+                    busy = True
+                    break
+                if raw[:key_length] != name:
+                    continue
+                return flags, raw[key_length:], expiry or None, index
+            if not busy:
+                return None
+        return None
+
+    def __find(self, name, digest):
+        """
+        查找键名所在的槽位，需持有写入锁
+        :param name: 键名字节串
+        :param digest: 键名摘要
+        :return: tuple (槽位序号, 组内首个槽位序号)，不存在时槽位序号为None
+        """
+        buf = self.__buf
+        first = (digest % self.__buckets) * self.__ways
+        fields = self.__bucket.unpack_from(buf, self.__meta(first))
+        for way in range(self.__ways):
+            key_length, key_digest = fields[way * self.__FIELDS + 1:way * self.__FIELDS + 3]
+            if key_digest != digest or key_length != len(name):
+                continue
+            offset = self.__data + (first + way) * self.__slot_size
+            if buf[offset:offset + key_length] == name:
+                return first + way, first
+        return None, first
+
+    def __victim(self, first):
+        """
+        选择组内用于写入新条目的槽位：空槽位、已过期条目、最久未访问的条目，需持有写入锁
+        :param first: 组内首个槽位序号
+        :return: int 槽位序号
+        """
+        fields = self.__bucket.unpack_from(self.__buf, self.__meta(first))
+        now = time.time()
+        victim = None
+        oldest = None
+        for way in range(self.__ways):
+            key_length, expiry, atime = fields[way * self.__FIELDS + 1], fields[way * self.__FIELDS + 3], fields[way * self.__FIELDS + 6]
+            if key_length == 0 or (expiry and expiry <= now):
+                return first + way
+            if oldest is None or atime < oldest:
+                victim = first + way
+                oldest = atime
+        return victim
+
+    def __write(self, index, name, digest, expiry, flags, value):
+        """
+        按seqlock协议改写槽位：序列号置为奇数，写入元数据及数据，再置为偶数，需持有写入锁
+        :param index: 槽位序号
+        :param name: 键名字节串，空字节串表示清空槽位
+        :param digest: 键名摘要
+        :param expiry: 过期时间戳，None表示永久有效
+        :param flags: 值类型，0为原始字节，1为pickle
+        :param value: 值字节串
+        :return: void
+        """
+        buf = self.__buf
+        meta = self.__meta(index)
+        seq = self.__SEQ.unpack_from(buf, meta)[0]
+        seq += seq & 1  # 写入进程中途退出时遗留的奇数序列号
+        self.__SEQ.pack_into(buf, meta, (seq + 1) & 0xFFFFFFFF)
+        self.__BODY.pack_into(buf, meta + 4, len(name), digest, expiry or 0.0, len(value), flags, time.time())
+        if len(name) > 0:
+            offset = self.__data + index * self.__slot_size
+            buf[offset:offset + len(name)] = name
+            buf[offset + len(name):offset + len(name) + len(value)] = value
+        self.__SEQ.pack_into(buf, meta, (seq + 2) & 0xFFFFFFFF)
+
+    @staticmethod
+    def __expiry(duration, expiry_time):
+        """
+        计算过期时间戳
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: float None表示永久有效
+        """
+        if expiry_time is not None:
+            return expiry_time.timestamp()
+        if duration is not None:
+            return time.time() + duration
+        return None
+
+    @staticmethod
+    def __encode(val):
+        """
+        编码值，bytes-like值保持原始字节
+        :param val: cache值
+        :return: tuple (值类型, 值字节)
+        """
+        if isinstance(val, (bytes, bytearray, memoryview)):
+            return 0, memoryview(val).cast("B")
+        return 1, pickle.dumps(val, pickle.HIGHEST_PROTOCOL)
+
+    def __store(self, key, val, expiry):
+        """
+        写入条目，需持有写入锁
+        :param key: cache键名
+        :param val: cache值
+        :param expiry: 过期时间戳
+        :return: bool 值过大无法写入时返回False，同时删除该键原有的条目
+        """
+        name = key.encode("utf-8")
+        digest = self.__hash(name)
+        flags, value = self.__encode(val)
+        index, first = self.__find(name, digest)
+        if len(name) + len(value) > self.__slot_size:
+            if index is not None:
+                self.__write(index, b"", 0, None, 0, b"")
+            return False
+        if index is None:
+            index = self.__victim(first)
+        self.__write(index, name, digest, expiry, flags, value)
+        return True
 
     def set(self, key, val, duration=None, expiry_time=None):
         """
         设置一个cache
         :param key: cache键名
         :param val: cache值
-        :param duration: 有效时长，单位秒。
+        :param duration: 有效时长，单位秒
         :param expiry_time: 过期时间，权重大于duration
-        :return: void
+        :return: bool 键名及值的长度之和超过槽位容量时不写入并返回False
         """
-        full_path = self.__path + os.path.sep + key + ".pkl"
-        if expiry_time is not None:  # expiry_time 优先处理
-            pass
-        elif duration is not None:
-            expiry_time = datetime.datetime.now() + datetime.timedelta(seconds=duration)
-        data = {
-            'val': val,
-            'expiry_time': expiry_time
-        }
-        with open(full_path, 'wb+') as store:
-            # store.truncate()
-            pickle.dump(data, store, protocol=2)
+        expiry = self.__expiry(duration, expiry_time)
+        with self.__writer():
+            return self.__store(key, val, expiry)
 
-    def get(self, key):
+    def get(self, key, default=None):
         """
-        获取一个cache
+        获取一个cache，不加锁
         :param key: cache键名
-        :return: mixed
+        :param default: 不存在或已过期时的返回值
+        :return: mixed 原始字节存放的值以bytes返回
         """
-        full_path = self.__path + os.path.sep + key + ".pkl"
-        if os.path.isfile(full_path):
-            with open(full_path, 'rb') as store:
-                data = pickle.load(store)
-                if data["expiry_time"] is None:  # None表示永久有效
-                    return data["val"]
-                else:
-                    if data["expiry_time"] > datetime.datetime.now():
-                        return data["val"]
-                    else:
-                        return None
-        else:
-            return None
+        name = key.encode("utf-8")
+        entry = self.__read(name, self.__hash(name))
+        if entry is None:
+            return default
+        flags, value, expiry, index = entry
+        now = time.time()
+        if expiry is not None and expiry <= now:
+            return default
+        self.__ATIME.pack_into(self.__buf, self.__meta(index) + self.__ATIME_OFFSET, now)
+        if flags == 0:
+            return value
+        return pickle.loads(value)
 
     def has(self, key):
         """
-        判断是否存在cache
+        判断是否存在未过期的cache
         :param key: cache键名
-        :return: 
+        :return: bool
+        """
+        name = key.encode("utf-8")
+        entry = self.__read(name, self.__hash(name))
+        return entry is not None and (entry[2] is None or entry[2] > time.time())
+
+    def add(self, key, val, duration=None, expiry_time=None):
+        """
+        仅当cache不存在(或已过期)时设置
+        :param key: cache键名
+        :param val: cache值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: bool 是否设置成功
+        """
+        expiry = self.__expiry(duration, expiry_time)
+        with self.__writer():
+            if self.has(key):
+                return False
+            return self.__store(key, val, expiry)
+
+    def incr(self, key, delta=1, duration=None):
+        """
+        对数值cache做原子增减，不存在时从0开始，已存在时保留原过期时间
+        :param key: cache键名
+        :param delta: 增量
+        :param duration: 新建时的有效时长，单位秒
+        :return: 增减后的值
         """
-        return self.get(key) is not None
+        name = key.encode("utf-8")
+        with self.__writer():
+            entry = self.__read(name, self.__hash(name))
+            if entry is None or (entry[2] is not None and entry[2] <= time.time()):
+                val = delta
+                expiry = time.time() + duration if duration is not None else None
+            else:
+                val = pickle.loads(entry[1]) + delta
+                expiry = entry[2]
+            self.__store(key, val, expiry)
+            return val
 
     def remove(self, key):
         """
         删除指定cache
         :param key: cache键名
-        :return: 
+        :return: void
         """
-        full_path = self.__path + os.path.sep + key + ".pkl"
-        if os.path.isfile(full_path):
-            os.remove(full_path)
+        name = key.encode("utf-8")
+        with self.__writer():
+            index = self.__find(name, self.__hash(name))[0]
+            if index is not None:
+                self.__write(index, b"", 0, None, 0, b"")
+
+    def get_many(self, keys):
+        """
+        批量获取cache
+        :param keys: cache键名数组
+        :return: dict 键名 => 值，不存在或已过期的键不包含在内
+        """
+        result = {}
+        for key in keys:
+            val = self.get(key, _MISSING)
+            if val is not _MISSING:
+                result[key] = val
+        return result
+
+    def set_many(self, mapping, duration=None, expiry_time=None):
+        """
+        批量设置cache，只获取一次写入锁
+        :param mapping: dict 键名 => 值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: list 值过大未能写入的键名
+        """
+        expiry = self.__expiry(duration, expiry_time)
+        skipped = []
+        with self.__writer():
+            for key, val in mapping.items():
+                if not self.__store(key, val, expiry):
+                    skipped.append(key)
+        return skipped
+
+    def delete_many(self, keys):
+        """
+        批量删除cache，只获取一次写入锁
+        :param keys: cache键名数组
+        :return: void
+        """
+        with self.__writer():
+            for key in keys:
+                name = key.encode("utf-8")
+                index = self.__find(name, self.__hash(name))[0]
+                if index is not None:
+                    self.__write(index, b"", 0, None, 0, b"")
+
+    def __scan(self, expired_only):
+        """
+        清空槽位，需持有写入锁
+        :param expired_only: 是否只清空已过期的条目
+        :return: int 清空的条目数
+        """
+        now = time.time()
+        removed = 0
+        for first in range(0, self.__buckets * self.__ways, self.__ways):
+            fields = self.__bucket.unpack_from(self.__buf, self.__meta(first))
+            for way in range(self.__ways):
+                key_length, expiry = fields[way * self.__FIELDS + 1], fields[way * self.__FIELDS + 3]
+                if key_length == 0 or (expired_only and not (expiry and expiry <= now)):
+                    continue
+                self.__write(first + way, b"", 0, None, 0, b"")
+                removed += 1
+        return removed
+
+    def sweep(self):
+        """
+        清理全部过期条目
+        :return: int 删除的条目数
+        """
+        with self.__writer():
+            return self.__scan(True)
 
     def clear(self):
         """
         清空所有cache
-        :return: 
+        :return: void
         """
-        import shutil
-        shutil.rmtree(self.__path)
+        with self.__writer():
+            self.__scan(False)
+
+    def close(self):
+        """
+        断开当前进程与共享内存段的连接，不影响其他进程
+        :return: void
+        """
+        self.__buf = None
+        self.__shm.close()
+
+    def unlink(self):
+        """
+        删除共享内存段，已连接的进程仍可使用至断开连接
+        :return: void
+        """
+        if not self.__tracked():  # Python 3.13以下unlink()会注销跟踪，需先恢复注册
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.register(self.__shm._name, "shared_memory")
+            except Exception:
+                pass
+        self.__shm.unlink()
+
+
+class _WriterLock:
+    """
+    SharedMemoryCache的写入锁，先获取线程锁再获取文件锁
+    """
+
+    def __init__(self, thread_lock, path):
+        self.__thread_lock = thread_lock
+        self.__file_lock = FileLock(path)
+
+    def __enter__(self):
+        self.__thread_lock.acquire()
+        try:
+            self.__file_lock.acquire()
+        except BaseException:
+            self.__thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.__file_lock.release()
+        finally:
+            self.__thread_lock.release()
+
+
+class _NullLock:
+    """
+    不加锁时使用的空上下文
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class AsyncCache:
+    """
+    asyncio原生的Cache接口
+    文件读写在有界线程池中执行，不阻塞事件循环；同一键名的并发get只读取一次文件。
+    内部使用Cache，磁盘格式与Cache完全一致，同步与异步代码可以共享同一个缓存目录。
+    """
+
+    def __init__(self, path=None, max_workers=4, cache=None, **kwargs):
+        """
+        初始化
+        :param path: 指定路径，不指定则默认为当前目录下的cache文件夹
+        :param max_workers: 执行文件读写的最大线程数
+        :param cache: 直接使用已有的Cache对象，指定时忽略path及其他参数
+        :param kwargs: 其余参数传递给Cache
+        """
+        if cache is None:
+            cache = Cache(path, **kwargs)
+        self.__cache = cache
+        self.__executor = ThreadPoolExecutor(max_workers, thread_name_prefix="fize-async-cache")
+        self.__inflight = {}  # 键名 => Future
+
+    @property
+    def cache(self):
+        """
+        内部使用的同步Cache对象
+        :return: Cache
+        """
+        return self.__cache
+
+    async def __run(self, func, *args):
+        """
+        在线程池中执行同步操作
+        :param func: 函数
+        :param args: 参数
+        :return: mixed
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.__executor, func, *args)
+
+    async def get(self, key, default=None):
+        """
+        获取一个cache，内存缓存层命中时不进入线程池
+        :param key: cache键名
+        :param default: 不存在或已过期时的返回值
+        :return: mixed
+        """
+        memory = self.__cache.memory
+        if memory is not None:
+            val = memory.get(key, _MISSING)
+            if val is not _MISSING and not isinstance(val, _TaggedValue):  # 带标签的条目需校验版本号
+                return val
+        future = self.__inflight.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = loop.run_in_executor(self.__executor, self.__cache.get, key, _MISSING)
+            self.__inflight[key] = future
+            future.add_done_callback(lambda done: self.__inflight.pop(key, None) if self.__inflight.get(key) is done else None)
+        val = await asyncio.shield(future)
+        return default if val is _MISSING else val
+
+    async def set(self, key, val, duration=None, expiry_time=None):
+        """
+        设置一个cache
+        :param key: cache键名
+        :param val: cache值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: void
+        """
+        self.__inflight.pop(key, None)
+        await self.__run(self.__cache.set, key, val, duration, expiry_time)
+
+    async def has(self, key):
+        """
+        判断是否存在未过期的cache
+        :param key: cache键名
+        :return: bool
+        """
+        return await self.__run(self.__cache.has, key)
+
+    async def remove(self, key):
+        """
+        删除指定cache
+        :param key: cache键名
+        :return: void
+        """
+        self.__inflight.pop(key, None)
+        await self.__run(self.__cache.remove, key)
+
+    async def get_many(self, keys):
+        """
+        批量获取cache
+        :param keys: cache键名数组
+        :return: dict 键名 => 值，不存在或已过期的键不包含在内
+        """
+        return await self.__run(self.__cache.get_many, list(keys))
+
+    async def set_many(self, mapping, duration=None, expiry_time=None):
+        """
+        批量设置cache
+        :param mapping: dict 键名 => 值
+        :param duration: 有效时长，单位秒
+        :param expiry_time: 过期时间，权重大于duration
+        :return: void
+        """
+        for key in mapping:
+            self.__inflight.pop(key, None)
+        await self.__run(self.__cache.set_many, dict(mapping), duration, expiry_time)
+
+    async def delete_many(self, keys):
+        """
+        批量删除cache
+        :param keys: cache键名数组
+        :return: void
+        """
+        keys = list(keys)
+        for key in keys:
+            self.__inflight.pop(key, None)
+        await self.__run(self.__cache.delete_many, keys)
+
+    async def clear(self):
+        """
+        清空所有cache
+        :return: void
+        """
+        self.__inflight.clear()
+        await self.__run(self.__cache.clear)
+
+    def close(self):
+        """
+        关闭线程池
+        :return: void
+        """
+        self.__executor.shutdown(wait=True)
+
+
+class _SingleFlight:
+    """
+    按键名的线程级互斥锁，同一键名的并发未命中只由一个线程计算
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__locks = {}  # 键名 => [锁, 引用数]
+
+    def acquire(self, key):
+        """
+        获取键名对应的锁
+        :param key: 键名
+        :return: void
+        """
+        with self.__lock:
+            entry = self.__locks.get(key)
+            if entry is None:
+                entry = [threading.Lock(), 0]
+                self.__locks[key] = entry
+            entry[1] += 1
+        entry[0].acquire()
+
+    def release(self, key):
+        """
+        释放键名对应的锁
+        :param key: 键名
+        :return: void
+        """
+        with self.__lock:
+            entry = self.__locks[key]
+            entry[0].release()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.__locks[key]
+
+
+_MISSING = object()
+
+_default_cache = None
+
+_default_cache_lock = threading.Lock()
+
+_single_flight = _SingleFlight()
+
+_async_inflight = {}  # (事件循环ID, 键名) => Future
+
+_refresh_pool = None
+
+
+def default_cache():
+    """
+    获取装饰器默认使用的Cache对象，进程内只创建一次
+    :return: Cache
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = Cache()
+    return _default_cache
+
+
+def make_key(func, args, kwargs):
+    """
+    根据函数及调用参数生成cache键名
+    :param func: 函数
+    :param args: 位置参数
+    :param kwargs: 关键字参数
+    :return: str
+    """
+    try:
+        source = pickle.dumps((args, sorted(kwargs.items())), protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:  # 无法pickle的参数使用repr
+        source = repr((args, sorted(kwargs.items()))).encode("utf-8")
+    name = getattr(func, '__qualname__', func.__name__)
+    return func.__module__ + "." + name + ":" + hashlib.sha1(source).hexdigest()
+
+
+def _expiry_time(until):
+    """
+    计算until对应的过期时间
+    :param until: datetime.time表示每天的该时刻过期，datetime.datetime表示固定时刻，也可以是返回datetime的函数
+    :return: datetime
+    """
+    if until is None:
+        return None
+    if callable(until):
+        return until()
+    if isinstance(until, datetime.datetime):
+        return until
+    now = datetime.datetime.now()
+    expiry_time = datetime.datetime.combine(now.date(), until)
+    if expiry_time <= now:
+        expiry_time += datetime.timedelta(days=1)
+    return expiry_time
+
+
+def _refresh_executor():
+    """
+    获取后台刷新使用的线程池，进程内只创建一次
+    :return: ThreadPoolExecutor
+    """
+    global _refresh_pool
+    if _refresh_pool is None:
+        with _default_cache_lock:
+            if _refresh_pool is None:
+                _refresh_pool = ThreadPoolExecutor(4, thread_name_prefix="fize-refresh")
+    return _refresh_pool
+
+
+def memoize(ttl=None, until=None, key=None, backend=None, process_lock=True, stale=None, refresh_ahead=None, error_backoff=5, max_backoff=300):
+    """
+    装饰器，按调用参数缓存函数结果，支持普通函数及async函数
+    同一键名的并发未命中只计算一次：线程间使用按键名的互斥锁，进程间使用backend的文件锁(如有)
+    指定stale或refresh_ahead时启用后台刷新：过期后的stale秒内仍返回旧值并由一个后台任务重新计算，
+    临近过期时按XFetch算法以逐渐升高的概率提前刷新，刷新失败时按指数退避重试并继续返回旧值。
+    :param ttl: 有效时长，单位秒
+    :param until: 过期时刻，datetime.time表示每天的该时刻，也可以是datetime或返回datetime的函数，权重大于ttl
+    :param key: 自定义键名函数，参数与被装饰函数相同，默认使用函数名及参数的摘要
+    :param backend: 缓存对象，需提供get(key, default)/set/remove，默认使用进程内共享的Cache()
+    :param process_lock: 是否使用backend.lock()进行跨进程的单次计算
+    :param stale: 过期后仍可返回旧值的宽限时间，单位秒
+    :param refresh_ahead: 提前刷新系数(XFetch的beta，通常为1)，越大越早刷新，None表示不提前刷新
+    :param error_backoff: 后台刷新失败后的首次重试间隔，单位秒，之后每次翻倍
+    :param max_backoff: 后台刷新失败后的最长重试间隔，单位秒
+    :return: 装饰器
+    """
+    revalidate = (stale is not None or refresh_ahead is not None) and (ttl is not None or until is not None)
+    grace = stale if stale is not None else 0
+    refreshing = set()  # 本进程正在后台刷新的键名
+    refreshing_lock = threading.Lock()
+
+    def decorator(func):
+        def cache_key(args, kwargs):
+            if key is not None:
+                return key(*args, **kwargs)
+            return make_key(func, args, kwargs)
+
+        def store():
+            return backend if backend is not None else default_cache()
+
+        def process_guard(cache, name):
+            if process_lock and hasattr(cache, 'lock'):
+                return cache.lock(name)
+            return _NullLock()
+
+        def expiry_of():
+            expiry_time = _expiry_time(until)
+            if expiry_time is not None:
+                return expiry_time.timestamp()
+            return time.time() + ttl
+
+        def save(cache, name, val, delta):
+            """写入缓存，后台刷新模式下包装为带逻辑过期时间的信封"""
+            if not revalidate:
+                cache.set(name, val, ttl, _expiry_time(until))
+                return
+            expiry = expiry_of()
+            envelope = {'__fize_swr__': 1, 'val': val, 'expiry': expiry, 'delta': delta, 'failures': 0, 'retry_at': 0}
+            cache.set(name, envelope, max(1, expiry + grace - time.time()))
+
+        def unwrap(val):
+            """返回(值, 信封)，非信封格式的值视为新鲜值"""
+            if revalidate and isinstance(val, dict) and '__fize_swr__' in val:
+                return val['val'], val
+            return val, None
+
+        def needs_refresh(envelope):
+            if envelope is None:
+                return False
+            now = time.time()
+            if now < envelope['retry_at']:
+                return False
+            if now >= envelope['expiry']:
+                return True
+            if refresh_ahead is None or envelope['delta'] <= 0:
+                return False
+            # XFetch: 越接近过期、计算越慢，提前刷新的概率越高
+            return now - envelope['delta'] * refresh_ahead * math.log(random.random() or 1e-12) >= envelope['expiry']
+
+        def claim(cache, name, envelope):
+            """获取刷新权：进程内通过集合，进程间通过backend.add()租约"""
+            with refreshing_lock:
+                if name in refreshing:
+                    return False
+                refreshing.add(name)
+            if hasattr(cache, 'add') and not cache.add(name + ":refreshing", 1, max(10, envelope['delta'] * 3)):
+                with refreshing_lock:
+                    refreshing.discard(name)
+                return False
+            return True
+
+        def finish(cache, name):
+            if hasattr(cache, 'add'):
+                cache.remove(name + ":refreshing")
+            with refreshing_lock:
+                refreshing.discard(name)
+
+        def failed(cache, name, envelope):
+            """刷新失败：记录失败次数并延长旧值的可用时间"""
+            failures = envelope['failures'] + 1
+            backoff = min(error_backoff * 2 ** (failures - 1), max_backoff)
+            envelope = dict(envelope, failures=failures, retry_at=time.time() + backoff)
+            remain = max(envelope['expiry'] + grace, envelope['retry_at'] + grace) - time.time()
+            cache.set(name, envelope, max(1, remain))
+
+        if asyncio.iscoroutinefunction(func):
+            tasks = set()
+
+            async def blocking(fn, *args):
+                """在默认线程池中执行backend的读写及文件锁操作，避免阻塞事件循环"""
+                return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+            async def refresh_async(cache, name, envelope, args, kwargs):
+                try:
+                    start = time.time()
+                    val = await func(*args, **kwargs)
+                    await blocking(save, cache, name, val, time.time() - start)
+                except Exception:
+                    await blocking(failed, cache, name, envelope)
+                finally:
+                    await blocking(finish, cache, name)
+
+            @wraps(func)
+            async def async_wrap(*args, **kwargs):
+                name = cache_key(args, kwargs)
+                cache = store()
+                val = await blocking(cache.get, name, _MISSING)
+                if val is not _MISSING:
+                    val, envelope = unwrap(val)
+                    if needs_refresh(envelope) and await blocking(claim, cache, name, envelope):
+                        task = asyncio.ensure_future(refresh_async(cache, name, envelope, args, kwargs))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    return val
+                loop = asyncio.get_event_loop()
+                flight = (id(loop), name)
+                future = _async_inflight.get(flight)
+                if future is not None:
+                    return await asyncio.shield(future)
+                future = loop.create_future()
+                _async_inflight[flight] = future
+                guard = process_guard(cache, name)
+                try:
+                    if isinstance(guard, FileLock):
+                        await blocking(guard.acquire)
+                    try:
+                        val = await blocking(cache.get, name, _MISSING)
+                        if val is _MISSING:
+                            start = time.time()
+                            val = await func(*args, **kwargs)
+                            await blocking(save, cache, name, val, time.time() - start)
+                        else:
+                            val = unwrap(val)[0]
+                    finally:
+                        if isinstance(guard, FileLock):
+                            guard.release()
+                    future.set_result(val)
+                    return val
+                except BaseException as e:
+                    future.set_exception(e)
+                    future.exception()  # 没有其他等待者时避免“exception was never retrieved”警告
+                    raise
+                finally:
+                    del _async_inflight[flight]
+
+            async_wrap.invalidate = lambda *args, **kwargs: store().remove(cache_key(args, kwargs))
+            return async_wrap
+
+        def refresh(cache, name, envelope, args, kwargs):
+            try:
+                start = time.time()
+                val = func(*args, **kwargs)
+                save(cache, name, val, time.time() - start)
+            except Exception:
+                failed(cache, name, envelope)
+            finally:
+                finish(cache, name)
+
+        @wraps(func)
+        def wrap(*args, **kwargs):
+            name = cache_key(args, kwargs)
+            cache = store()
+            val = cache.get(name, _MISSING)
+            if val is not _MISSING:
+                val, envelope = unwrap(val)
+                if needs_refresh(envelope) and claim(cache, name, envelope):
+                    _refresh_executor().submit(refresh, cache, name, envelope, args, kwargs)
+                return val
+            _single_flight.acquire(name)
+            try:
+                val = cache.get(name, _MISSING)  # 等待期间其他线程可能已完成计算
+                if val is not _MISSING:
+                    return unwrap(val)[0]
+                with process_guard(cache, name):
+                    val = cache.get(name, _MISSING)
+                    if val is not _MISSING:
+                        return unwrap(val)[0]
+                    start = time.time()
+                    val = func(*args, **kwargs)
+                    save(cache, name, val, time.time() - start)
+                    return val
+            finally:
+                _single_flight.release(name)
+
+        wrap.invalidate = lambda *args, **kwargs: store().remove(cache_key(args, kwargs))
+        return wrap
+
+    return decorator
 
 
 def cache_daily(func):
     """
-    装饰器，用于缓存函数结果一天
+    装饰器，用于缓存函数结果至当天23:59:59，按调用参数区分
     :param func: 
     :return: 
     """
-    @wraps(func)
-    def wrap(*args):
-        cache = Cache()
-        val = cache.get(func.__name__)
-        if val is not None:
-            return val
-        else:
-            result = func(*args)
-            cache.set(func.__name__, result, expiry_time=datetime.datetime.strptime(datetime.datetime.now().strftime("%Y-%m-%d") + " 23:59:59", "%Y-%m-%d %H:%M:%S"))
-            return result
-    return wrap
+    return memoize(until=datetime.time(23, 59, 59))(func)